@@ -6,9 +6,29 @@ When a property appears multiple times within a :PROPERTIES: block,
 this script keeps the second occurrence and removes the first one.
 """
 
+import re
 import sys
 from pathlib import Path
 
+# One token per interesting line: a top-level heading, the start or end of
+# a properties drawer, or a ":NAME: value" property line. Everything else
+# is copied through untouched. Works on the raw UTF-8 bytes so the file
+# never has to be decoded as a whole.
+ORG_TOKEN_RE = re.compile(
+    rb'^[^\S\n]*(?:'
+    rb'\* (.*)'                     # heading text
+    rb'|(:PROPERTIES:)[^\S\n]*$'
+    rb'|(:END:)[^\S\n]*$'
+    rb'|:([^:\n]*):(.*)'            # property name, raw value
+    rb')',
+    re.MULTILINE
+)
+
+# Token kinds, as reported by match.lastindex for ORG_TOKEN_RE
+HEADING = 1
+PROPERTIES_START = 2
+PROPERTIES_END = 3
+
 
 def deduplicate_properties(input_file: str, output_file: str) -> dict:
     """
@@ -29,102 +49,146 @@ def deduplicate_properties(input_file: str, output_file: str) -> dict:
         'duplicate_details': []  # List of (entry_title, property_name, first_value, second_value)
     }
 
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    with open(input_file, 'rb') as f:
+        data = f.read()
 
-    result_lines = []
+    removed_spans = []  # (start, end) offsets of first occurrences to drop
     in_properties = False
-    current_properties = {}  # property_name -> (line_index, line_content)
-    duplicates_in_current_block = []
+    # property_name (bytes) -> (line_start, line_end, value); one dict is
+    # reused for every drawer instead of allocating a new one per entry
+    current_properties = {}
+    block_has_duplicates = False
     current_entry_title = None
 
-    i = 0
-    while i < len(lines):
-        line = lines[i]
+    # Line numbers are only needed for the duplicate log, so count
+    # newlines lazily from the last position we looked at
+    line_number = 1
+    counted_to = 0
+
+    for m in ORG_TOKEN_RE.finditer(data):
+        # The token kind is a single integer, no string compares needed
+        kind = m.lastindex
 
         # Track entry titles (lines starting with *)
-        if line.strip().startswith('* ') and not in_properties:
-            current_entry_title = line.strip()[2:].strip()
+        if kind == HEADING:
+            title = m.group(1).strip()
+            if title and not in_properties:
+                current_entry_title = title
+            continue
 
         # Check if we're entering a properties block
-        if line.strip() == ':PROPERTIES:':
+        if kind == PROPERTIES_START:
             in_properties = True
-            current_properties = {}
-            duplicates_in_current_block = []
-            result_lines.append(line)
+            current_properties.clear()
+            block_has_duplicates = False
             stats['total_entries'] += 1
-            i += 1
             continue
 
         # Check if we're exiting a properties block
-        if line.strip() == ':END:':
+        if kind == PROPERTIES_END:
             in_properties = False
-            if duplicates_in_current_block:
+            if block_has_duplicates:
                 stats['entries_with_duplicates'] += 1
-            current_properties = {}
-            duplicates_in_current_block = []
-            result_lines.append(line)
-            i += 1
+            block_has_duplicates = False
             continue
 
-        # Process property lines
-        if in_properties and line.strip().startswith(':') and line.strip().endswith(':') == False:
-            # Extract property name (e.g., ":YEAR:" from ":YEAR: 2021")
-            property_line = line.strip()
-            if ':' in property_line[1:]:  # Skip first colon
-                prop_name = property_line.split(':', 2)[1]  # Get the part between first and second colon
-                prop_value = property_line.split(':', 2)[2].strip() if len(property_line.split(':', 2)) > 2 else ""
+        if not in_properties:
+            continue
 
-                # Check if this property was already seen
-                if prop_name in current_properties:
-                    # This is a duplicate - skip the FIRST occurrence
-                    first_occurrence_idx, first_line_content = current_properties[prop_name]
-                    first_value = first_line_content.strip().split(':', 2)[2].strip() if len(first_line_content.strip().split(':', 2)) > 2 else ""
-
-                    # Log the duplicate
-                    stats['duplicate_details'].append({
-                        'entry': current_entry_title or '(unknown)',
-                        'property': prop_name,
-                        'first_value': first_value,
-                        'second_value': prop_value,
-                        'line_number': i + 1
-                    })
-
-                    # Mark that we found a duplicate
-                    duplicates_in_current_block.append(prop_name)
-                    stats['total_duplicates_removed'] += 1
-                    stats['duplicates_by_property'][prop_name] = stats['duplicates_by_property'].get(prop_name, 0) + 1
-
-                    # Remove the first occurrence from result_lines
-                    # We need to find it by searching backwards from current position
-                    for j in range(len(result_lines) - 1, -1, -1):
-                        if result_lines[j] == lines[first_occurrence_idx]:
-                            del result_lines[j]
-                            break
-
-                    # Update the property tracker with the new (second) occurrence
-                    current_properties[prop_name] = (i, line)
-                    result_lines.append(line)
-                else:
-                    # First occurrence of this property
-                    current_properties[prop_name] = (i, line)
-                    result_lines.append(line)
-            else:
-                # Not a standard property line, just append
-                result_lines.append(line)
-        else:
-            # Not in properties block or not a property line
-            result_lines.append(line)
-
-        i += 1
+        # Process property lines (":NAME:" with an empty value or a
+        # trailing colon is not a standard property line)
+        prop_name, prop_value = m.group(4, 5)
+        prop_value = prop_value.strip()
+        if not prop_value or prop_value.endswith(b':'):
+            continue
+
+        # Check if this property was already seen
+        if prop_name in current_properties:
+            # This is a duplicate - skip the FIRST occurrence
+            first_start, first_end, first_value = current_properties[prop_name]
+
+            line_number += data.count(b'\n', counted_to, m.start())
+            counted_to = m.start()
+
+            # Only decode what ends up in the log
+            name = prop_name.decode('utf-8')
+
+            # Log the duplicate
+            stats['duplicate_details'].append({
+                'entry': current_entry_title.decode('utf-8') if current_entry_title else '(unknown)',
+                'property': name,
+                'first_value': first_value.decode('utf-8'),
+                'second_value': prop_value.decode('utf-8'),
+                'line_number': line_number
+            })
+
+            # Mark that we found a duplicate
+            block_has_duplicates = True
+            stats['total_duplicates_removed'] += 1
+            stats['duplicates_by_property'][name] = stats['duplicates_by_property'].get(name, 0) + 1
+
+            # Drop the first occurrence (and its newline) when the output
+            # is assembled
+            if data.startswith(b'\n', first_end):
+                first_end += 1
+            removed_spans.append((first_start, first_end))
+
+        # Track the latest occurrence of this property
+        current_properties[prop_name] = (m.start(), m.end(), prop_value)
+
+    # Stitch the output together from the text between removed lines.
+    # First occurrences can be removed out of order within a block.
+    removed_spans.sort()
+    pieces = [b''] * (len(removed_spans) + 1)
+    pos = 0
+    for k, (start, end) in enumerate(removed_spans):
+        pieces[k] = data[pos:start]
+        pos = end
+    pieces[-1] = data[pos:]
 
     # Write the result
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.writelines(result_lines)
+    with open(output_file, 'wb') as f:
+        f.writelines(pieces)
 
     return stats
 
 
+def dedupe_entry(lines: list[str]) -> tuple[list[str], int]:
+    """
+    Deduplicate properties in the lines of a single org entry.
+
+    Applies the same rules as deduplicate_properties (the last occurrence
+    of a property in a drawer wins) for callers that already hold one
+    entry in memory, such as enrich_metadata.py --dedupe.
+
+    Returns:
+        Tuple of (lines, number of duplicates removed); the input list is
+        returned as-is when there is nothing to remove
+    """
+    in_properties = False
+    current_properties = {}  # property_name -> index in lines
+    removed = set()
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped == ':PROPERTIES:':
+            in_properties = True
+            current_properties.clear()
+        elif stripped == ':END:':
+            in_properties = False
+        elif in_properties and stripped.startswith(':') and not stripped.endswith(':'):
+            prop_name, sep, _ = stripped[1:].partition(':')
+            if sep:
+                if prop_name in current_properties:
+                    removed.add(current_properties[prop_name])
+                current_properties[prop_name] = i
+
+    if not removed:
+        return lines, 0
+
+    return [line for i, line in enumerate(lines) if i not in removed], len(removed)
+
+
 def main():
     input_file = 'resources/tv_liste.org'
     output_file = 'resources/tv_liste_deduplicated.org'
@@ -4,20 +4,54 @@ Phase 2: Enrich org file entries with detailed metadata from TMDB.
 Requires entries to already have TMDB_ID from Phase 1.
 """
 
+import os
 import re
 import sys
 import time
-import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, List, Dict
-import requests
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+
+try:
+    # orjson parses TMDB payloads several times faster when it is installed
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+from deduplicate_properties import dedupe_entry
 
 # TMDB API Configuration
 TMDB_BASE_URL = "https://api.themoviedb.org/3"
 
+# Number of requests in flight at once; tmdb_matcher.LIMITER caps the
+# rate, shared with the search scripts
+MAX_WORKERS = 8  # default, see --workers
+
+# One pooled session so worker threads reuse TLS connections to TMDB.
+# Created on first use, so usage and argument errors don't pay for
+# importing requests. Failed and rate limited (429) requests are retried
+# with tmdb_matcher's SEARCH_RETRY policy.
+SESSION = None
+
+# Large write buffer for the streamed rewrite of the org file
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Org markers looked at for every line of the file
+PROPERTIES_START = ':PROPERTIES:'
+PROPERTIES_END = ':END:'
+TMDB_ID_PROP = ':TMDB_ID:'
+BACKFILLED_PROP = ':BACKFILLED:'
+TMDB_ID_RE = re.compile(r':TMDB_ID:\s*(\d+)')
+
+# On-disk cache of raw TMDB responses, so re-runs don't hit the network
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'enrich_metadata'
+CACHE_MAX_AGE = 30 * 24 * 60 * 60  # 30 days, in seconds
+
 
 def get_api_key_from_pass() -> str:
     """Retrieve TMDB API key from GNU pass store."""
+    import subprocess
+
     try:
         result = subprocess.run(
             ['pass', 'tmdb/api-key'],
@@ -34,99 +68,319 @@ def get_api_key_from_pass() -> str:
         sys.exit(1)
 
 
-def fetch_movie_details(tmdb_id: int, api_key: str) -> Optional[Dict]:
+def get_session(pool_size: int = MAX_WORKERS):
+    """Return the shared requests session, creating it on first use."""
+    global SESSION
+    if SESSION is None:
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from tmdb_matcher import SEARCH_RETRY
+        except ImportError:
+            print("Error: requests or rapidfuzz library not found")
+            print("Install with: pip install requests rapidfuzz")
+            sys.exit(1)
+
+        SESSION = requests.Session()
+        SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                              max_retries=SEARCH_RETRY))
+    return SESSION
+
+
+def load_cached_response(tmdb_id: int) -> Optional[Dict]:
+    """Return the cached TMDB response for a movie, or None if missing or stale."""
+    cache_path = CACHE_DIR / f"{tmdb_id}.json"
+    try:
+        if time.time() - cache_path.stat().st_mtime < CACHE_MAX_AGE:
+            return json_loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_cached_response(tmdb_id: int, body: bytes):
+    """Atomically write a raw TMDB response body to the cache."""
+    cache_path = CACHE_DIR / f"{tmdb_id}.json"
+    temp_path = cache_path.with_suffix('.json.tmp')
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path.write_bytes(body)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not cache TMDB ID {tmdb_id}: {e}", file=sys.stderr)
+
+
+def fetch_movie_details(tmdb_id: int, api_key: str) -> Optional[List[str]]:
     """
     Fetch detailed movie metadata from TMDB.
 
-    Returns dict with:
+    Returns the org property lines to add, in this order:
     - year, runtime, original_title, original_language
-    - director, top_actors (list)
-    - countries (list), production_companies (list)
-    - genres (list)
+    - director, actors (top 3)
+    - countries, production_companies (top 3)
+    - genres
     - imdb_id, tmdb_rating, vote_count
-    """
-    url = f"{TMDB_BASE_URL}/movie/{tmdb_id}"
-    params = {
-        'api_key': api_key,
-        'language': 'de-DE',
-        'append_to_response': 'credits,external_ids'
-    }
+    Properties without a value are left out. Returns None on errors.
 
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+    Responses are served from the on-disk cache when fresh enough.
+    """
+    data = load_cached_response(tmdb_id)
 
-        # Extract metadata
-        metadata = {}
+    if data is None:
+        import requests
+        from tmdb_matcher import LIMITER
 
-        # Basic info
-        metadata['year'] = data.get('release_date', '').split('-')[0] if data.get('release_date') else None
-        metadata['runtime'] = data.get('runtime')
-        metadata['original_title'] = data.get('original_title')
-        metadata['original_language'] = data.get('original_language', '').upper()
+        url = f"{TMDB_BASE_URL}/movie/{tmdb_id}"
+        params = {
+            'api_key': api_key,
+            'language': 'de-DE',
+            'append_to_response': 'credits,external_ids'
+        }
 
-        # Director (from credits)
-        credits = data.get('credits', {})
-        crew = credits.get('crew', [])
-        directors = [person['name'] for person in crew if person.get('job') == 'Director']
-        metadata['director'] = directors[0] if directors else None
+        try:
+            LIMITER.acquire()
+            response = get_session().get(url, params=params, timeout=10)
+            response.raise_for_status()
+            data = json_loads(response.content)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error fetching details for TMDB ID {tmdb_id}: {e}", file=sys.stderr)
+            return None
 
-        # Top 3 actors (from cast)
-        cast = credits.get('cast', [])
-        metadata['top_actors'] = [actor['name'] for actor in cast[:3]]
+        store_cached_response(tmdb_id, response.content)
 
-        # Countries
-        countries = data.get('production_countries', [])
-        metadata['countries'] = [c['iso_3166_1'] for c in countries]
+    credits = data.get('credits', {})
+    external_ids = data.get('external_ids', {})
 
-        # Production companies
-        companies = data.get('production_companies', [])
-        metadata['production_companies'] = [c['name'] for c in companies[:3]]  # Top 3
+    # Director (from crew)
+    director = next((person['name'] for person in credits.get('crew', [])
+                     if person.get('job') == 'Director'), None)
 
-        # Genres
-        genres = data.get('genres', [])
-        metadata['genres'] = [g['name'] for g in genres]
+    release_date = data.get('release_date')
 
+    # Format each value straight into its property line
+    prop_lines = (
+        # Basic info
+        format_property('year', release_date.split('-')[0] if release_date else None),
+        format_property('runtime', data.get('runtime')),
+        format_property('original_title', data.get('original_title')),
+        format_property('original_language', data.get('original_language', '').upper()),
+        format_property('director', director),
+        # Top 3 actors (from cast)
+        format_property('actors', [actor['name'] for actor in credits.get('cast', [])[:3]]),
+        format_property('countries', [c['iso_3166_1'] for c in data.get('production_countries', [])]),
+        format_property('production_companies',
+                        [c['name'] for c in data.get('production_companies', [])[:3]]),
+        format_property('genres', [g['name'] for g in data.get('genres', [])]),
         # IMDB ID and rating
-        external_ids = data.get('external_ids', {})
-        metadata['imdb_id'] = external_ids.get('imdb_id')
-        metadata['tmdb_rating'] = data.get('vote_average')
-        metadata['vote_count'] = data.get('vote_count')
+        format_property('imdb_id', external_ids.get('imdb_id')),
+        format_property('tmdb_rating', data.get('vote_average')),
+        format_property('vote_count', data.get('vote_count')),
+    )
 
-        return metadata
+    return [line for line in prop_lines if line]
 
-    except requests.RequestException as e:
-        print(f"Error fetching details for TMDB ID {tmdb_id}: {e}", file=sys.stderr)
+
+def format_property(key: str, value: object) -> Optional[str]:
+    """Format a property line for org-mode, or None if there is no value."""
+    if isinstance(value, list):
+        if not value:
+            return None
+        # Join list with commas
+        value_str = ', '.join(map(str, value))
+    elif value is None or value == '':
         return None
+    else:
+        value_str = str(value)
+
+    return f":{key.upper()}: {value_str}\n"
 
 
-def write_lines_to_file(org_path: Path, lines: List[str]):
-    """Write lines to org file atomically."""
-    temp_path = org_path.with_suffix('.org.tmp')
-    with open(temp_path, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
-    temp_path.replace(org_path)
+def read_org_entries(f: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Group the lines of an org file into entries.
 
+    Each entry is a heading plus everything up to the next heading.
+    Lines before the first heading are yielded as their own chunk.
+    A properties drawer directly below a heading is always kept with
+    that heading, even if one of its lines happens to start with '*'.
+    """
+    entry = []
+    in_drawer = False
+
+    for line in f:
+        stripped = line.strip()
+        if in_drawer:
+            in_drawer = stripped != PROPERTIES_END
+        elif stripped.startswith('*'):
+            if entry:
+                yield entry
+            entry = []
+        elif stripped == PROPERTIES_START and len(entry) == 1 and entry[0].strip().startswith('*'):
+            in_drawer = True
+        entry.append(line)
+
+    if entry:
+        yield entry
+
+
+def scan_properties(entry: List[str]) -> Optional[Tuple[Optional[int], bool, int]]:
+    """
+    Scan the properties drawer right below an entry's heading.
 
-def format_property(key: str, value) -> str:
-    """Format a property line for org-mode."""
-    if value is None or value == '' or value == []:
+    Returns (tmdb_id, already_enriched, end_idx) where end_idx is the
+    index of the :END: line, or None if the entry has no drawer.
+    """
+    # Check if next line starts properties block
+    if not (len(entry) > 1 and entry[1].strip() == PROPERTIES_START):
         return None
 
-    if isinstance(value, list):
-        # Join list with commas
-        value_str = ', '.join(str(v) for v in value)
-    else:
-        value_str = str(value)
+    tmdb_id = None
+    already_enriched = False
 
-    return f":{key.upper()}: {value_str}\n"
+    # Index of :END:, or the end of the entry if the drawer is unterminated
+    end_idx = len(entry)
 
+    for i in range(2, len(entry)):
+        prop_line = entry[i].strip()
+        if prop_line == PROPERTIES_END:
+            end_idx = i
+            break
 
-def enrich_org_file(org_path: Path, api_key: str, backup: bool = True) -> Dict:
+        # Check for TMDB_ID
+        if prop_line.startswith(TMDB_ID_PROP):
+            value = prop_line[len(TMDB_ID_PROP):].strip()
+            if value.isdecimal():
+                tmdb_id = int(value)
+            else:
+                # Trailing junk after the ID, e.g. ":TMDB_ID: 123 (check)"
+                match = TMDB_ID_RE.search(prop_line)
+                if match:
+                    tmdb_id = int(match.group(1))
+
+        # Check if already enriched (has BACKFILLED property)
+        elif prop_line.startswith(BACKFILLED_PROP):
+            already_enriched = True
+
+    return tmdb_id, already_enriched, end_idx
+
+
+def index_entries(entries: List[List[str]]) -> List[Optional[Tuple[Optional[int], bool, int]]]:
+    """
+    Return one item per entry from read_org_entries: the scan_properties
+    result for headings with a drawer, None for everything else.
+    """
+    return [scan_properties(entry) if entry[0].strip().startswith('*') else None
+            for entry in entries]
+
+
+def pending_tmdb_ids(entry_index: List[Optional[Tuple[Optional[int], bool, int]]]) -> List[int]:
+    """Return the unique TMDB IDs of all entries that still need enrichment."""
+    tmdb_ids = {}
+    for scanned in entry_index:
+        if scanned and scanned[0] and not scanned[1]:
+            tmdb_ids[scanned[0]] = None
+    return list(tmdb_ids)
+
+
+def fetch_all_movie_details(tmdb_ids: List[int], api_key: str,
+                            workers: int = MAX_WORKERS) -> Dict[int, Optional[List[str]]]:
+    """
+    Fetch details for many movies concurrently, keyed by TMDB ID.
+    At most `workers` requests are in flight; LIMITER caps the rate.
+    """
+    # Create the session up front, with one pooled connection per worker
+    # so none are thrown away
+    get_session(workers)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {tmdb_id: executor.submit(fetch_movie_details, tmdb_id, api_key)
+                   for tmdb_id in tmdb_ids}
+
+        # Report progress as fetches finish, in whatever order they do
+        for done, _ in enumerate(as_completed(futures.values()), 1):
+            if done % 50 == 0 or done == len(futures):
+                print(f"  Fetched {done}/{len(futures)}")
+    finally:
+        # Don't leave queued fetches running if interrupted
+        executor.shutdown(cancel_futures=True)
+
+    return {tmdb_id: future.result() for tmdb_id, future in futures.items()}
+
+
+def enrich_entry(entry: List[str], scanned: Optional[Tuple[Optional[int], bool, int]],
+                 details: Dict[int, Optional[List[str]]], stats: Dict) -> List[str]:
+    """
+    Enrich a single org entry (as produced by read_org_entries) using its
+    precomputed scan result and prefetched movie details. Returns the
+    lines to write in its place and updates stats.
+    """
+    # Text before the first heading
+    if not entry[0].strip().startswith('*'):
+        return entry
+
+    stats['total_entries'] += 1
+
+    if scanned is None:
+        # No properties, skip this entry
+        return entry
+
+    tmdb_id, already_enriched, end_idx = scanned
+
+    # Determine if we should enrich
+    if not tmdb_id:
+        # No TMDB_ID, skip enrichment
+        stats['skipped_no_tmdb_id'] += 1
+        return entry
+
+    if already_enriched:
+        # Already has enrichment, skip
+        stats['skipped_already_enriched'] += 1
+        print(f"[{stats['total_entries']}] Skipping (already enriched): TMDB ID {tmdb_id}")
+        return entry
+
+    prop_lines = details.get(tmdb_id)
+
+    if prop_lines is None:
+        print(f"[{stats['total_entries']}] Enriching: TMDB ID {tmdb_id} → ERROR")
+        stats['errors'] += 1
+        # Keep existing properties
+        return entry
+
+    print(f"[{stats['total_entries']}] Enriching: TMDB ID {tmdb_id} → ✓")
+    stats['enriched'] += 1
+
+    # Heading, :PROPERTIES: and existing properties
+    output_lines = entry[:end_idx]
+
+    # Add new metadata properties (Tier 1)
+    output_lines.extend(prop_lines)
+
+    # Mark as backfilled
+    output_lines.append(":BACKFILLED: true\n")
+
+    # Add :END: and the rest of the entry content
+    output_lines.extend(entry[end_idx:])
+
+    return output_lines
+
+
+def enrich_org_file(org_path: Path, api_key: str, backup: bool = True, dedupe: bool = False,
+                    workers: int = MAX_WORKERS) -> Dict:
     """
     Enrich org file with detailed metadata from TMDB.
     Processes entries that have TMDB_ID but are missing enrichment.
+
+    The file is read once into entries. Every entry's drawer is scanned
+    into an index and the details of the TMDB IDs needing enrichment are
+    fetched concurrently, then the same entries are written one by one
+    into a temp file which replaces the original.
+    If the rewrite is aborted, the remaining entries are copied unchanged
+    so progress made so far is kept.
+
+    With dedupe, duplicate properties are removed from each entry in the
+    same pass (see deduplicate_properties.py), saving a separate
+    read/rewrite of the whole file.
     """
     # Backup original file
     if backup:
@@ -140,175 +394,46 @@ def enrich_org_file(org_path: Path, api_key: str, backup: bool = True) -> Dict:
         else:
             print(f"Backup already exists: {backup_path}\n")
 
-    with open(org_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
     stats = {
         'total_entries': 0,
         'enriched': 0,
         'skipped_no_tmdb_id': 0,
         'skipped_needs_review': 0,
         'skipped_already_enriched': 0,
-        'errors': 0
+        'errors': 0,
+        'duplicates_removed': 0
     }
 
-    output_lines = []
-    i = 0
-
-    while i < len(lines):
-        line = lines[i]
-
-        # Check if this is a movie heading
-        if line.strip().startswith('*'):
-            stats['total_entries'] += 1
-
-            # Check if next line starts properties block
-            has_properties = (i + 1 < len(lines) and
-                            lines[i + 1].strip() == ':PROPERTIES:')
-
-            if not has_properties:
-                # No properties, skip this entry
-                output_lines.append(line)
-                i += 1
-                continue
-
-            # Parse properties to find TMDB_ID
-            output_lines.append(line)  # heading
-            output_lines.append(lines[i + 1])  # :PROPERTIES:
-            i += 2
-
-            tmdb_id = None
-            already_enriched = False
-            needs_review = False
-            props_lines = []
-
-            # Read all properties
-            while i < len(lines) and not lines[i].strip() == ':END:':
-                prop_line = lines[i].strip()
-
-                # Check for TMDB_ID
-                if prop_line.startswith(':TMDB_ID:'):
-                    match = re.search(r':TMDB_ID:\s*(\d+)', prop_line)
-                    if match:
-                        tmdb_id = int(match.group(1))
-
-                # Check if already enriched (has BACKFILLED property)
-                if prop_line.startswith(':BACKFILLED:'):
-                    already_enriched = True
-
-                # Check if needs manual review
-                if prop_line.startswith(':NEEDS_REVIEW:') and 'true' in prop_line.lower():
-                    needs_review = True
-
-                props_lines.append(lines[i])
-                i += 1
-
-            # Determine if we should enrich
-            if not tmdb_id:
-                # No TMDB_ID, skip enrichment
-                stats['skipped_no_tmdb_id'] += 1
-                output_lines.extend(props_lines)
-                if i < len(lines):
-                    output_lines.append(lines[i])  # :END:
-                    i += 1
-
-                # Copy rest of entry
-                while i < len(lines) and not lines[i].strip().startswith('*'):
-                    output_lines.append(lines[i])
-                    i += 1
-                continue
-
-
-            if already_enriched:
-                # Already has enrichment, skip
-                stats['skipped_already_enriched'] += 1
-                print(f"[{stats['total_entries']}] Skipping (already enriched): TMDB ID {tmdb_id}")
-                output_lines.extend(props_lines)
-                if i < len(lines):
-                    output_lines.append(lines[i])  # :END:
-                    i += 1
-
-                # Copy rest of entry
-                while i < len(lines) and not lines[i].strip().startswith('*'):
-                    output_lines.append(lines[i])
-                    i += 1
-                continue
-
-            # Fetch and enrich
-            print(f"[{stats['total_entries']}] Enriching: TMDB ID {tmdb_id}", end='')
-            metadata = fetch_movie_details(tmdb_id, api_key)
-
-            if not metadata:
-                print(f" → ERROR")
-                stats['errors'] += 1
-                # Keep existing properties
-                output_lines.extend(props_lines)
-                if i < len(lines):
-                    output_lines.append(lines[i])  # :END:
-                    i += 1
-
-                # Copy rest of entry
-                while i < len(lines) and not lines[i].strip().startswith('*'):
-                    output_lines.append(lines[i])
-                    i += 1
-                continue
-
-            print(f" → ✓")
-            stats['enriched'] += 1
-
-            # Add existing properties
-            output_lines.extend(props_lines)
-
-            # Add new metadata properties (Tier 1)
-            # Define order of properties for consistency
-            property_order = [
-                ('year', metadata.get('year')),
-                ('runtime', metadata.get('runtime')),
-                ('original_title', metadata.get('original_title')),
-                ('original_language', metadata.get('original_language')),
-                ('director', metadata.get('director')),
-                ('actors', metadata.get('top_actors')),
-                ('countries', metadata.get('countries')),
-                ('production_companies', metadata.get('production_companies')),
-                ('genres', metadata.get('genres')),
-                ('imdb_id', metadata.get('imdb_id')),
-                ('tmdb_rating', metadata.get('tmdb_rating')),
-                ('vote_count', metadata.get('vote_count'))
-            ]
-
-            for key, value in property_order:
-                prop_line = format_property(key, value)
-                if prop_line:
-                    output_lines.append(prop_line)
-
-            # Mark as backfilled
-            output_lines.append(":BACKFILLED: true\n")
-
-            # Add :END:
-            if i < len(lines):
-                output_lines.append(lines[i])  # :END:
-                i += 1
-
-            # Copy rest of entry content
-            while i < len(lines) and not lines[i].strip().startswith('*'):
-                output_lines.append(lines[i])
-                i += 1
-
-            # Write incrementally
-            remaining_lines = lines[i:]
-            write_lines_to_file(org_path, output_lines + remaining_lines)
-
-            # Rate limiting
-            time.sleep(0.25)
-            continue
-
-        # Not a heading, copy as-is
-        output_lines.append(line)
-        i += 1
-
-    # Final write
-    if output_lines:
-        write_lines_to_file(org_path, output_lines)
+    # Read once: the index and the rewrite must see the same entries
+    with open(org_path, 'r', encoding='utf-8') as f:
+        entries = list(read_org_entries(f))
+
+    if dedupe:
+        for k, entry in enumerate(entries):
+            entries[k], removed = dedupe_entry(entry)
+            stats['duplicates_removed'] += removed
+
+    entry_index = index_entries(entries)
+    tmdb_ids = pending_tmdb_ids(entry_index)
+    print(f"Fetching details for {len(tmdb_ids)} movies ({workers} workers)...\n")
+    details = fetch_all_movie_details(tmdb_ids, api_key, workers)
+
+    temp_path = org_path.with_suffix('.org.tmp')
+    with open(temp_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as out:
+        written = 0
+        try:
+            for scanned, entry in zip(entry_index, entries):
+                out.writelines(enrich_entry(entry, scanned, details, stats))
+                written += 1
+        except BaseException:
+            # Keep what was enriched so far, copy the rest as-is
+            for entry in entries[written:]:
+                out.writelines(entry)
+            out.close()
+            temp_path.replace(org_path)
+            raise
+
+    temp_path.replace(org_path)
 
     return stats
 
@@ -324,6 +449,8 @@ def print_statistics(stats: Dict):
     print(f"Skipped (needs review):  {stats['skipped_needs_review']}")
     print(f"Skipped (already done):  {stats['skipped_already_enriched']}")
     print(f"Errors:                  {stats['errors']}")
+    if stats.get('duplicates_removed', 0) > 0:
+        print(f"Duplicates removed:      {stats['duplicates_removed']}")
     print(f"\nNext steps:")
     print(f"1. Review entries marked with :NEEDS_REVIEW: and fix TMDB_ID")
     print(f"2. Re-run this script after fixing reviewed entries")
@@ -333,15 +460,30 @@ def print_statistics(stats: Dict):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python enrich_metadata.py <org_file> [tmdb_api_key] [--no-backup]")
+        print("Usage: python enrich_metadata.py <org_file> [tmdb_api_key] [--no-backup] [--dedupe] [--workers=N]")
         print("\nIf tmdb_api_key is not provided, will retrieve from 'pass tmdb/api-key'")
+        print("Use --dedupe to also remove duplicate properties in the same pass")
+        print(f"Use --workers=N to change the number of concurrent TMDB requests (default {MAX_WORKERS})")
         sys.exit(1)
 
     org_path = Path(sys.argv[1])
     backup = '--no-backup' not in sys.argv
+    dedupe = '--dedupe' in sys.argv
+
+    # Parse workers argument
+    workers = MAX_WORKERS
+    for arg in sys.argv:
+        if arg.startswith('--workers='):
+            try:
+                workers = int(arg.split('=')[1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print(f"Invalid workers value: {arg}", file=sys.stderr)
+                sys.exit(1)
 
     # Get API key
-    if len(sys.argv) >= 3 and sys.argv[2] != '--no-backup':
+    if len(sys.argv) >= 3 and not sys.argv[2].startswith('--'):
         api_key = sys.argv[2]
     else:
         print("Retrieving API key from pass store (tmdb/api-key)...")
@@ -351,16 +493,9 @@ def main():
         print(f"Error: File not found: {org_path}")
         sys.exit(1)
 
-    try:
-        import requests
-    except ImportError:
-        print("Error: requests library not found")
-        print("Install with: pip install requests")
-        sys.exit(1)
-
     print(f"Processing: {org_path}\n")
 
-    stats = enrich_org_file(org_path, api_key, backup)
+    stats = enrich_org_file(org_path, api_key, backup, dedupe, workers)
     print_statistics(stats)
 
 
@@ -10,40 +10,37 @@ Features:
 - Skips entries that already have TMDB_ID
 """
 
+import os
 import re
 import sys
-import time
-import subprocess
+import shutil
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple
-import requests
-from rapidfuzz import fuzz
-
-# TMDB API Configuration
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
-TMDB_SEARCH_URL = f"{TMDB_BASE_URL}/search/movie"
-
-# Matching thresholds
-HIGH_CONFIDENCE_THRESHOLD = 85
-MEDIUM_CONFIDENCE_THRESHOLD = 70
-
-
-def get_api_key_from_pass() -> str:
-    """Retrieve TMDB API key from GNU pass store."""
-    try:
-        result = subprocess.run(
-            ['pass', 'tmdb/api-key'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error retrieving API key from pass: {e}", file=sys.stderr)
-        sys.exit(1)
-    except FileNotFoundError:
-        print("Error: 'pass' command not found. Please install pass or provide API key as argument.", file=sys.stderr)
-        sys.exit(1)
+from requests.adapters import HTTPAdapter
+
+from tmdb_matcher import (
+    HIGH_CONFIDENCE_THRESHOLD,
+    MEDIUM_CONFIDENCE_THRESHOLD,
+    MAX_WORKERS,
+    SEARCH_RETRY,
+    SESSION,
+    find_best_match,
+    get_api_key_from_pass,
+    open_search_cache,
+)
+
+# Org heading and property patterns, compiled once
+HEADING_RE = re.compile(r'^\*\s+(.+)$')
+YEAR_RE = re.compile(r"[´']?(\d{4})")
+TITLE_NOISE_RE = re.compile(r"\([^)]*\)|[´']")  # parenthetical metadata and quotes
+PROPERTY_RE = re.compile(r'^:(\w+):\s*(.*)$')
+
+# Write the org file back after this many matched movies. Re-runs skip
+# entries that already have a TMDB_ID, so at most this many searches
+# are repeated (from the search cache) after an interruption.
+WRITE_EVERY = 20
 
 
 def parse_org_title(line: str) -> Optional[Tuple[str, str, Optional[int]]]:
@@ -51,7 +48,7 @@ def parse_org_title(line: str) -> Optional[Tuple[str, str, Optional[int]]]:
     Parse an org-mode heading to extract movie title and metadata hints.
     Returns: (original_title, cleaned_title, year_hint) or None
     """
-    match = re.match(r'^\*\s+(.+)$', line.strip())
+    match = HEADING_RE.match(line.strip())
     if not match:
         return None
 
@@ -59,138 +56,104 @@ def parse_org_title(line: str) -> Optional[Tuple[str, str, Optional[int]]]:
 
     # Extract year from various patterns: (1964), ´1964, '2016
     # Only accept years between 1920 and 2025
-    year_match = re.search(r"[´']?(\d{4})", full_title)
+    year_match = YEAR_RE.search(full_title)
     if year_match:
         potential_year = int(year_match.group(1))
         year = potential_year if 1920 <= potential_year <= 2025 else None
     else:
         year = None
 
-    # Remove parenthetical metadata for cleaned title
-    cleaned = re.sub(r'\([^)]*\)', '', full_title).strip()
-    # Remove quotes and special characters
-    cleaned = re.sub(r"[´']", '', cleaned)
-    # Remove trailing underscores and slashes
-    cleaned = re.sub(r'[_/]\s*$', '', cleaned)
+    # Remove parenthetical metadata, quotes and special characters in
+    # one pass
+    cleaned = TITLE_NOISE_RE.sub('', full_title).rstrip()
+    # Remove a trailing underscore or slash
+    if cleaned.endswith(('_', '/')):
+        cleaned = cleaned[:-1]
     # Normalize spaces
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    cleaned = ' '.join(cleaned.split())
 
     return (full_title, cleaned, year)
 
 
-def search_tmdb(title: str, year: Optional[int], api_key: str) -> List[Dict]:
-    """Search TMDB for a movie title."""
-    params = {
-        'api_key': api_key,
-        'query': title,
-        'language': 'de-DE',
-        'include_adult': False
-    }
-
-    if year:
-        params['year'] = year
-
-    try:
-        response = requests.get(TMDB_SEARCH_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('results', [])
-    except requests.RequestException as e:
-        print(f"Error searching TMDB for '{title}': {e}", file=sys.stderr)
-        return []
-
-
-def calculate_match_score(original: str, tmdb_title: str, tmdb_original_title: str,
-                         year_hint: Optional[int], tmdb_year: Optional[str]) -> float:
-    """Calculate confidence score for a TMDB match."""
-    score_title = fuzz.ratio(original.lower(), tmdb_title.lower())
-    score_original = fuzz.ratio(original.lower(), tmdb_original_title.lower())
-    base_score = max(score_title, score_original)
-
-    # Boost score if years match
-    if year_hint and tmdb_year:
-        tmdb_year_int = int(tmdb_year.split('-')[0]) if tmdb_year else None
-        if tmdb_year_int == year_hint:
-            base_score = min(100, base_score + 10)
-        elif abs(tmdb_year_int - year_hint) <= 1:
-            base_score = min(100, base_score + 5)
-
-    return base_score
-
-
-def find_best_match(cleaned_title: str, year_hint: Optional[int], api_key: str) -> Dict:
-    """Find the best TMDB match for a movie title."""
-    # Try with year first if available
-    results = search_tmdb(cleaned_title, year_hint, api_key)
-
-    # If no results with year, try without
-    if not results and year_hint:
-        time.sleep(0.25)
-        results = search_tmdb(cleaned_title, None, api_key)
-
-    if not results:
-        return {
-            'tmdb_id': None,
-            'confidence': 0,
-            'tmdb_title': None,
-            'needs_review': True,
-            'match_status': 'NO_RESULTS'
-        }
-
-    # Score all results
-    scored_results = []
-    for result in results[:10]:
-        score = calculate_match_score(
-            cleaned_title,
-            result.get('title', ''),
-            result.get('original_title', ''),
-            year_hint,
-            result.get('release_date')
-        )
-        scored_results.append((score, result))
-
-    # Get best match
-    scored_results.sort(reverse=True, key=lambda x: x[0])
-    best_score, best_result = scored_results[0]
-
-    needs_review = best_score < HIGH_CONFIDENCE_THRESHOLD
-    match_status = 'HIGH_CONFIDENCE' if best_score >= HIGH_CONFIDENCE_THRESHOLD else \
-                   'MEDIUM_CONFIDENCE' if best_score >= MEDIUM_CONFIDENCE_THRESHOLD else \
-                   'LOW_CONFIDENCE'
-
-    return {
-        'tmdb_id': best_result.get('id'),
-        'confidence': round(best_score, 2),
-        'tmdb_title': best_result.get('title'),
-        'tmdb_original_title': best_result.get('original_title'),
-        'needs_review': needs_review,
-        'match_status': match_status
-    }
-
-
 def write_lines_to_file(org_path: Path, lines: List[str]):
     """Write lines to org file atomically."""
-    # Write to temp file first, then rename for atomicity
+    # Encode everything once and write it to a temp file, then rename
+    # for atomicity
+    data = memoryview(''.join(lines).encode('utf-8'))
     temp_path = org_path.with_suffix('.org.tmp')
-    with open(temp_path, 'w', encoding='utf-8') as f:
-        f.writelines(lines)
-    temp_path.replace(org_path)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(temp_path, org_path)
+
+    # Flush the rename itself to disk (POSIX only)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(org_path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def parse_properties(lines: List[str], i: int) -> Dict[str, str]:
+    """Parse the properties drawer below the heading at lines[i], if any."""
+    properties = {}
+    if i + 1 < len(lines) and lines[i + 1].strip() == ':PROPERTIES:':
+        j = i + 2
+        while j < len(lines) and not lines[j].strip() == ':END:':
+            prop_match = PROPERTY_RE.match(lines[j].strip())
+            if prop_match:
+                key = prop_match.group(1)
+                value = prop_match.group(2).strip()
+                properties[key] = value
+            j += 1
+    return properties
+
+
+def collect_searches(lines: List[str],
+                     heading_positions: List[int]) -> List[Tuple[int, str, Optional[int]]]:
+    """
+    Find the movie entries that need a TMDB search.
+    Returns (heading line index, search query, year hint) for each, in
+    file order, skipping entries process_org_file would skip.
+    """
+    searches = []
+    for i in heading_positions:
+        parsed = parse_org_title(lines[i])
+        if not parsed:
+            continue
+
+        _, cleaned_title, year_hint = parsed
+        properties = parse_properties(lines, i)
+        if properties.get('AI_VERIFIED') == 'true' and properties.get('NEEDS_REVIEW') == 'false':
+            continue
+        if 'TMDB_ID' in properties:
+            continue
 
+        searches.append((i, properties.get('SUGGESTED_SEARCH', cleaned_title), year_hint))
+    return searches
 
-def process_org_file(org_path: Path, api_key: str, backup: bool = True) -> Dict:
+
+def process_org_file(org_path: Path, api_key: str, backup: bool = True,
+                     workers: int = MAX_WORKERS) -> Dict:
     """
     Process org file, match movies to TMDB, and write IDs to properties.
-    Writes incrementally after each movie for resumability.
+
+    All searches are submitted up front and run concurrently (at most
+    `workers` at a time); the file is then rewritten in order as their
+    results come in, writing incrementally every WRITE_EVERY movies for
+    resumability.
     Returns statistics about the processing.
     """
     # Backup original file on first run only
     if backup:
         backup_path = org_path.with_suffix('.org.bak')
         if not backup_path.exists():
-            with open(org_path, 'r', encoding='utf-8') as f:
-                backup_lines = f.readlines()
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.writelines(backup_lines)
+            shutil.copyfile(org_path, backup_path)
             print(f"Backup created: {backup_path}\n")
         else:
             print(f"Backup already exists: {backup_path}\n")
@@ -207,166 +170,189 @@ def process_org_file(org_path: Path, api_key: str, backup: bool = True) -> Dict:
         'used_suggested_search': 0
     }
 
-    # Re-read file each time to get latest state (in case of previous incremental writes)
+    # The whole file is kept as a list of lines, since entries are copied
+    # out of it as slices. readlines() splits on '\n' only, unlike
+    # str.splitlines(), which would also break lines at form feeds or
+    # U+2028 (and is slower here).
     with open(org_path, 'r', encoding='utf-8') as f:
         lines = f.readlines()
 
-    output_lines = []
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-
-        # Check if this is a movie heading
-        if line.strip().startswith('*'):
-            parsed = parse_org_title(line)
-
-            if parsed:
-                original_title, cleaned_title, year_hint = parsed
-                stats['total'] += 1
-
-                # Check if next line starts properties block
-                has_properties = (i + 1 < len(lines) and
-                                lines[i + 1].strip() == ':PROPERTIES:')
-
-                # Parse properties if they exist
-                properties = {}
-                if has_properties:
-                    j = i + 2
-                    while j < len(lines) and not lines[j].strip() == ':END:':
-                        prop_match = re.match(r'^:(\w+):\s*(.*)$', lines[j].strip())
-                        if prop_match:
-                            key = prop_match.group(1)
-                            value = prop_match.group(2).strip()
-                            properties[key] = value
-                        j += 1
-
-                # Check if already verified by AI
-                if properties.get('AI_VERIFIED') == 'true' and properties.get('NEEDS_REVIEW') == 'false':
-                    print(f"[{stats['total']}] Skipping (AI verified): {cleaned_title}")
-                    stats['skipped_verified'] += 1
-                    output_lines.append(line)
-                    i += 1
-                    while i < len(lines) and not lines[i].strip().startswith('*'):
-                        output_lines.append(lines[i])
-                        i += 1
-                    continue
-
-                # Check if already has TMDB_ID
-                if 'TMDB_ID' in properties:
-                    print(f"[{stats['total']}] Skipping (already has TMDB_ID): {cleaned_title}")
-                    stats['skipped'] += 1
-                    output_lines.append(line)
-                    i += 1
-                    while i < len(lines) and not lines[i].strip().startswith('*'):
-                        output_lines.append(lines[i])
-                        i += 1
-                    continue
+    # Index of every line starting with '*', so entry bodies can be
+    # copied as one slice up to the next one
+    heading_positions = [k for k, line in enumerate(lines) if line.strip().startswith('*')]
 
-                # Check for SUGGESTED_SEARCH property
-                search_query = cleaned_title
-                if 'SUGGESTED_SEARCH' in properties:
-                    search_query = properties['SUGGESTED_SEARCH']
-                    stats['used_suggested_search'] += 1
-                    print(f"[{stats['total']}] Processing (using suggested): {search_query}", end='')
-                else:
-                    print(f"[{stats['total']}] Processing: {cleaned_title}", end='')
-
-                # Search TMDB
-                match_info = find_best_match(search_query, year_hint, api_key)
-
-                # Update stats
-                if match_info['tmdb_id'] is None:
-                    stats['no_match'] += 1
-                elif match_info['confidence'] >= HIGH_CONFIDENCE_THRESHOLD:
-                    stats['high_confidence'] += 1
-                elif match_info['confidence'] >= MEDIUM_CONFIDENCE_THRESHOLD:
-                    stats['medium_confidence'] += 1
-                else:
-                    stats['low_confidence'] += 1
-
-                # Print result
-                status_icon = "✓" if not match_info['needs_review'] else "⚠"
-                print(f" → {status_icon} {match_info['match_status']} ({match_info['confidence']}%)")
-
-                # Write heading
-                output_lines.append(line)
+    def next_heading(start: int) -> int:
+        """Index of the first heading line at or after start (or len(lines))."""
+        k = bisect.bisect_left(heading_positions, start)
+        return heading_positions[k] if k < len(heading_positions) else len(lines)
 
-                # Handle properties block
-                if has_properties:
-                    # Properties exist, add TMDB info
-                    output_lines.append(lines[i + 1])  # :PROPERTIES:
-                    i += 2
-
-                    # Copy existing properties, but skip SUGGESTED_SEARCH if match found
-                    props_lines = []
-                    while i < len(lines) and not lines[i].strip() == ':END:':
-                        # Skip SUGGESTED_SEARCH if we found a match
-                        if not (lines[i].strip().startswith(':SUGGESTED_SEARCH:') and match_info['tmdb_id']):
-                            props_lines.append(lines[i])
-                        i += 1
+    # One pooled connection per worker
+    SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers,
+                                          max_retries=SEARCH_RETRY))
+    cache = open_search_cache(org_path)
+    executor = ThreadPoolExecutor(max_workers=workers)
 
-                    # Add all existing properties
-                    output_lines.extend(props_lines)
+    # Search for every movie needing a TMDB ID, keyed by heading line index
+    searches = collect_searches(lines, heading_positions)
+    print(f"Searching TMDB for {len(searches)} movies ({workers} workers)...\n")
+    matches = {i: executor.submit(find_best_match, query, year_hint, api_key, cache)
+               for i, query, year_hint in searches}
 
-                    # Add TMDB properties
-                    if match_info['tmdb_id']:
-                        output_lines.append(f":TMDB_ID: {match_info['tmdb_id']}\n")
-                        output_lines.append(f":TMDB_TITLE: {match_info['tmdb_title']}\n")
-                        output_lines.append(f":TMDB_CONFIDENCE: {match_info['confidence']}\n")
-                    if match_info['needs_review']:
-                        output_lines.append(":NEEDS_REVIEW: true\n")
+    try:
+        output_lines = []
+        processed_since_flush = 0
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+
+            # Check if this is a movie heading
+            if line.strip().startswith('*'):
+                parsed = parse_org_title(line)
+
+                if parsed:
+                    original_title, cleaned_title, year_hint = parsed
+                    stats['total'] += 1
+
+                    # Check if next line starts properties block
+                    has_properties = (i + 1 < len(lines) and
+                                    lines[i + 1].strip() == ':PROPERTIES:')
+
+                    # Parse properties if they exist
+                    properties = parse_properties(lines, i)
+
+                    # Check if already verified by AI
+                    if properties.get('AI_VERIFIED') == 'true' and properties.get('NEEDS_REVIEW') == 'false':
+                        print(f"[{stats['total']}] Skipping (AI verified): {cleaned_title}")
+                        stats['skipped_verified'] += 1
+                        end = next_heading(i + 1)
+                        output_lines.extend(lines[i:end])
+                        i = end
+                        continue
+
+                    # Check if already has TMDB_ID
+                    if 'TMDB_ID' in properties:
+                        print(f"[{stats['total']}] Skipping (already has TMDB_ID): {cleaned_title}")
+                        stats['skipped'] += 1
+                        end = next_heading(i + 1)
+                        output_lines.extend(lines[i:end])
+                        i = end
+                        continue
+
+                    # Check for SUGGESTED_SEARCH property
+                    search_query = cleaned_title
+                    if 'SUGGESTED_SEARCH' in properties:
+                        search_query = properties['SUGGESTED_SEARCH']
+                        stats['used_suggested_search'] += 1
+                        print(f"[{stats['total']}] Processing (using suggested): {search_query}", end='')
+                    else:
+                        print(f"[{stats['total']}] Processing: {cleaned_title}", end='')
+
+                    # Wait for this movie's search
+                    match_info = matches[i].result()
+
+                    # Update stats
+                    if match_info['tmdb_id'] is None:
+                        stats['no_match'] += 1
+                    elif match_info['confidence'] >= HIGH_CONFIDENCE_THRESHOLD:
+                        stats['high_confidence'] += 1
+                    elif match_info['confidence'] >= MEDIUM_CONFIDENCE_THRESHOLD:
+                        stats['medium_confidence'] += 1
+                    else:
+                        stats['low_confidence'] += 1
+
+                    # Print result
+                    status_icon = "✓" if not match_info['needs_review'] else "⚠"
+                    print(f" → {status_icon} {match_info['match_status']} ({match_info['confidence']}%)")
+
+                    # Write heading
+                    output_lines.append(line)
 
-                    # Add :END:
-                    if i < len(lines):
-                        output_lines.append(lines[i])  # :END:
+                    # Handle properties block
+                    if has_properties:
+                        # Properties exist, add TMDB info
+                        output_lines.append(lines[i + 1])  # :PROPERTIES:
+                        i += 2
+
+                        # Copy existing properties, but skip SUGGESTED_SEARCH if match found
+                        props_lines = []
+                        while i < len(lines) and not lines[i].strip() == ':END:':
+                            # Skip SUGGESTED_SEARCH if we found a match
+                            if not (lines[i].strip().startswith(':SUGGESTED_SEARCH:') and match_info['tmdb_id']):
+                                props_lines.append(lines[i])
+                            i += 1
+
+                        # Add all existing properties
+                        output_lines.extend(props_lines)
+
+                        # Add TMDB properties
+                        if match_info['tmdb_id']:
+                            output_lines.append(f":TMDB_ID: {match_info['tmdb_id']}\n")
+                            output_lines.append(f":TMDB_TITLE: {match_info['tmdb_title']}\n")
+                            output_lines.append(f":TMDB_CONFIDENCE: {match_info['confidence']}\n")
+                        if match_info['needs_review']:
+                            output_lines.append(":NEEDS_REVIEW: true\n")
+
+                        # Add :END:
+                        if i < len(lines):
+                            output_lines.append(lines[i])  # :END:
+                            i += 1
+
+                        # Copy remaining content for this entry (body text, blank lines, etc.)
+                        end = next_heading(i)
+                        output_lines.extend(lines[i:end])
+                        i = end
+
+                        # Write incrementally every WRITE_EVERY movies
+                        processed_since_flush += 1
+                        if processed_since_flush >= WRITE_EVERY:
+                            remaining_lines = lines[i:]
+                            write_lines_to_file(org_path, output_lines + remaining_lines)
+                            processed_since_flush = 0
+                        continue
+
+                    else:
+                        # No properties block, create one
                         i += 1
+                        output_lines.append(':PROPERTIES:\n')
+                        if match_info['tmdb_id']:
+                            output_lines.append(f":TMDB_ID: {match_info['tmdb_id']}\n")
+                            output_lines.append(f":TMDB_TITLE: {match_info['tmdb_title']}\n")
+                            output_lines.append(f":TMDB_CONFIDENCE: {match_info['confidence']}\n")
+                        if match_info['needs_review']:
+                            output_lines.append(":NEEDS_REVIEW: true\n")
+                        output_lines.append(':END:\n')
 
                     # Copy remaining content for this entry (body text, blank lines, etc.)
-                    while i < len(lines) and not lines[i].strip().startswith('*'):
-                        output_lines.append(lines[i])
-                        i += 1
-
-                    # Write incrementally after processing this movie
-                    remaining_lines = lines[i:]
-                    write_lines_to_file(org_path, output_lines + remaining_lines)
-
-                    # Rate limiting
-                    time.sleep(0.25)
+                    end = next_heading(i)
+                    output_lines.extend(lines[i:end])
+                    i = end
+
+                    # Write incrementally every WRITE_EVERY movies
+                    # Append remaining unprocessed lines
+                    processed_since_flush += 1
+                    if processed_since_flush >= WRITE_EVERY:
+                        remaining_lines = lines[i:]
+                        write_lines_to_file(org_path, output_lines + remaining_lines)
+                        processed_since_flush = 0
                     continue
 
-                else:
-                    # No properties block, create one
-                    i += 1
-                    output_lines.append(':PROPERTIES:\n')
-                    if match_info['tmdb_id']:
-                        output_lines.append(f":TMDB_ID: {match_info['tmdb_id']}\n")
-                        output_lines.append(f":TMDB_TITLE: {match_info['tmdb_title']}\n")
-                        output_lines.append(f":TMDB_CONFIDENCE: {match_info['confidence']}\n")
-                    if match_info['needs_review']:
-                        output_lines.append(":NEEDS_REVIEW: true\n")
-                    output_lines.append(':END:\n')
-
-                # Copy remaining content for this entry (body text, blank lines, etc.)
-                while i < len(lines) and not lines[i].strip().startswith('*'):
-                    output_lines.append(lines[i])
-                    i += 1
-
-                # Write incrementally after processing this movie
-                # Append remaining unprocessed lines
-                remaining_lines = lines[i:]
-                write_lines_to_file(org_path, output_lines + remaining_lines)
-
-                # Rate limiting
-                time.sleep(0.25)
+                # Heading that isn't a movie, copy as-is
+                output_lines.append(line)
+                i += 1
                 continue
 
-        # Not a movie heading or not parsed, copy as-is
-        output_lines.append(line)
-        i += 1
-
-    # Final write for any remaining non-movie lines at end of file
-    if output_lines:
-        write_lines_to_file(org_path, output_lines)
+            # Text outside movie entries, copy as-is up to the next heading
+            end = next_heading(i)
+            output_lines.extend(lines[i:end])
+            i = end
+
+        # Final write for any remaining non-movie lines at end of file
+        if output_lines:
+            write_lines_to_file(org_path, output_lines)
+    finally:
+        # Don't leave searches running if the rewrite is aborted
+        executor.shutdown(cancel_futures=True)
+        cache.close()
 
     return stats
 
@@ -10,10 +10,32 @@ Maps:
   notes -> AI_NOTES
 """
 
-import json
 import re
 from pathlib import Path
 
+try:
+    # orjson parses the batch files several times faster when it is installed
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+from rapidfuzz import fuzz, process, utils
+
+# Curly apostrophes and dashes are folded to their ASCII forms, and runs
+# of whitespace to one space, before titles are compared
+TITLE_CHARS = str.maketrans({"\u2018": "'", "\u2019": "'", "\u2013": "-", "\u2014": "-"})
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Similarity above which an unmatched title is printed as a candidate for
+# manual review. Candidates are never applied: near-identical titles are
+# often different films ("Grasgeflüster" vs "Grabgeflüster").
+FUZZY_MATCH_THRESHOLD = 90
+
+
+def title_key(title: str) -> str:
+    """Lookup key for a title that ignores apostrophe, dash and whitespace variants."""
+    return WHITESPACE_RE.sub(" ", title.translate(TITLE_CHARS)).strip()
+
 
 def load_knowledge_batches(batches_dir: Path) -> dict[str, dict]:
     """Load all batch*.json files and return a dict keyed by title."""
@@ -22,24 +44,29 @@ def load_knowledge_batches(batches_dir: Path) -> dict[str, dict]:
 
     for batch_file in batch_files:
         print(f"Loading {batch_file.name}...")
-        with open(batch_file, "r", encoding="utf-8") as f:
-            entries = json.load(f)
-            for entry in entries:
-                title = entry.get("title")
-                if title:
-                    knowledge[title] = entry
+        entries = json_loads(batch_file.read_bytes())
+        for entry in entries:
+            title = entry.get("title")
+            if title:
+                knowledge[title] = entry
 
     print(f"Loaded {len(knowledge)} entries from {len(batch_files)} batch files")
     return knowledge
 
 
-def parse_org_file(org_path: Path) -> list[dict]:
-    """Parse org file into a list of entries with their line ranges."""
+def parse_org_file(org_path: Path) -> tuple[list[dict], list[str]]:
+    """
+    Parse org file into a list of entries with their line ranges.
+    Returns (entries, lines), so the file doesn't have to be read again
+    to rewrite it.
+    """
     with open(org_path, "r", encoding="utf-8") as f:
         lines = f.readlines()
 
     entries = []
     current_entry = None
+    # Properties of the current entry while inside its drawer, else None
+    properties = None
 
     for i, line in enumerate(lines):
         # Check for headline
@@ -56,18 +83,25 @@ def parse_org_file(org_path: Path) -> list[dict]:
                 "properties_end": None,
                 "properties": {},
             }
-        elif current_entry is not None:
-            if line.strip() == ":PROPERTIES:":
-                current_entry["properties_start"] = i
-            elif line.strip() == ":END:":
-                current_entry["properties_end"] = i
-            elif current_entry["properties_start"] is not None and current_entry["properties_end"] is None:
-                # Parse property line
-                match = re.match(r":([^:]+):\s*(.*)", line.strip())
-                if match:
-                    prop_name = match.group(1)
-                    prop_value = match.group(2)
-                    current_entry["properties"][prop_name] = prop_value
+            properties = None
+            continue
+
+        if current_entry is None:
+            continue
+
+        stripped = line.strip()
+        if stripped == ":PROPERTIES:":
+            current_entry["properties_start"] = i
+            if current_entry["properties_end"] is None:
+                properties = current_entry["properties"]
+        elif stripped == ":END:":
+            current_entry["properties_end"] = i
+            properties = None
+        elif properties is not None and stripped.startswith(":"):
+            # Parse property line
+            prop_name, sep, prop_value = stripped[1:].partition(":")
+            if sep and prop_name:
+                properties[prop_name] = prop_value.lstrip()
 
     # Don't forget the last entry
     if current_entry is not None:
@@ -78,17 +112,46 @@ def parse_org_file(org_path: Path) -> list[dict]:
 
 
 def update_org_file(org_path: Path, knowledge: dict[str, dict]) -> int:
-    """Update org file with properties from knowledge entries."""
+    """
+    Update org file with properties from knowledge entries.
+
+    Entries are looked up by exact title, then by title_key, so titles that only differ in
+    apostrophes, dashes or whitespace still match. Titles without a match
+    are left alone; the most similar knowledge title, if any scores at
+    least FUZZY_MATCH_THRESHOLD, is printed for manual review.
+    """
     entries, lines = parse_org_file(org_path)
 
+    by_key = {title_key(title): k for title, k in knowledge.items()}
+
+    # Knowledge titles normalized once for the review candidates
+    titles = list(knowledge)
+    processed_titles = [utils.default_process(title) for title in titles]
+
+    # The updated file is assembled in one forward pass: unchanged text is
+    # copied as slices between the properties blocks that get replaced
+    out = []
+    cursor = 0
+
     updates = 0
-    # Process in reverse order so line numbers stay valid
-    for entry in reversed(entries):
+    for entry in entries:
         title = entry["title"]
-        if title not in knowledge:
+        k = knowledge.get(title) or by_key.get(title_key(title))
+        if k is None:
+            best = process.extractOne(utils.default_process(title), processed_titles,
+                                      scorer=fuzz.ratio, processor=None,
+                                      score_cutoff=FUZZY_MATCH_THRESHOLD)
+            if best is not None:
+                print(f"Unmatched, check manually ({best[1]:.0f}%): {title} -> {titles[best[2]]}")
             continue
 
-        k = knowledge[title]
+        # A drawer without :END:, or with :END: before :PROPERTIES:, can't
+        # be replaced safely, and adding a second one would duplicate it
+        start = entry["properties_start"]
+        end = entry["properties_end"]
+        if start is not None and (end is None or end < start):
+            print(f"Skipping {title}: malformed properties drawer at line {start + 1}")
+            continue
 
         # Build new properties to add/update
         new_props = {}
@@ -111,26 +174,30 @@ def update_org_file(org_path: Path, knowledge: dict[str, dict]) -> int:
         if not new_props:
             continue
 
-        # Merge with existing properties
-        merged_props = entry["properties"].copy()
-        merged_props.update(new_props)
-
-        # Build new properties block
-        prop_lines = [":PROPERTIES:\n"]
-        for prop_name, prop_value in merged_props.items():
-            prop_lines.append(f":{prop_name}: {prop_value}\n")
-        prop_lines.append(":END:\n")
-
-        # Replace the old properties block
-        start = entry["properties_start"]
-        end = entry["properties_end"] + 1  # Include the :END: line
-        lines[start:end] = prop_lines
+        # Replace the old properties block, or add one below the heading
+        if start is not None:
+            end += 1  # Include the :END: line
+        else:
+            start = end = entry["start_line"] + 1
+        out.extend(lines[cursor:start])
+        cursor = end
+
+        # Write the merged properties: existing ones in place (with
+        # updated values), then the new ones
+        out.append(":PROPERTIES:\n")
+        for prop_name, prop_value in entry["properties"].items():
+            out.append(f":{prop_name}: {new_props.pop(prop_name, prop_value)}\n")
+        for prop_name, prop_value in new_props.items():
+            out.append(f":{prop_name}: {prop_value}\n")
+        out.append(":END:\n")
 
         updates += 1
 
+    out.extend(lines[cursor:])
+
     # Write back
     with open(org_path, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+        f.writelines(out)
 
     return updates
 
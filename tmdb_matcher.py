@@ -0,0 +1,517 @@
+"""
+TMDB search and matching shared by match_movies.py and
+match_movies_suggested.py. The scripts only differ in which org entries
+they pick and what they search for; searching, scoring and writing the
+CSV happen here.
+
+update_tmdb_from_api.py and update_tmdb_from_suggested.py search through
+here as well (search_all_tmdb) and write their org file with
+write_org_file; they only keep their own parsing and confidence rules.
+enrich_org_tmdb.py uses the same search, search cache and matching.
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import sqlite3
+import operator
+import functools
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional, List, Dict, Set, Tuple
+
+try:
+    # orjson parses TMDB payloads several times faster when it is installed
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rapidfuzz import fuzz, process, utils
+
+# TMDB API Configuration
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_SEARCH_URL = f"{TMDB_BASE_URL}/search/movie"
+
+# Matching thresholds
+HIGH_CONFIDENCE_THRESHOLD = 85
+MEDIUM_CONFIDENCE_THRESHOLD = 70
+# Best matches scoring below this aren't reported at all (NO_MATCH)
+LOW_CONFIDENCE_THRESHOLD = 50
+
+# Score boost for a matching (or off by one) release year
+YEAR_MATCH_BONUS = 10
+NEAR_YEAR_BONUS = 5
+
+# Number of searches in flight at once; LIMITER still caps the rate
+MAX_WORKERS = 8  # default, see --workers
+
+# Rate limiting: TMDB allows 40 requests per 10 seconds, keep some headroom
+RATE_LIMIT_CALLS = 35
+RATE_LIMIT_WINDOW = 10.0  # seconds
+
+
+class RateLimiter:
+    """Sliding window limiter: at most `max_calls` requests per `window` seconds."""
+
+    def __init__(self, max_calls: int, window: float):
+        self.max_calls = max_calls
+        self.window = window
+        self.calls = deque()  # monotonic start times of recent requests
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block only if the current window is already full."""
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and self.calls[0] <= now - self.window:
+                self.calls.popleft()
+            if len(self.calls) >= self.max_calls:
+                time.sleep(self.calls[0] + self.window - now)
+                self.calls.popleft()
+            self.calls.append(time.monotonic())
+
+
+LIMITER = RateLimiter(RATE_LIMIT_CALLS, RATE_LIMIT_WINDOW)
+
+# Search results are cached next to the org file, so re-runs don't hit
+# the network (or wait for the rate limit) for titles already searched.
+# All scripts working on the same org file share its cache.
+SEARCH_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # 7 days, in seconds
+CACHE_LOCK = threading.Lock()  # the connection is shared by all worker threads
+
+# One session for all searches, so worker threads reuse their TLS
+# connections to TMDB. match_entries sizes its connection pool.
+# Rate limited (429) and failed requests are retried with backoff,
+# honouring the Retry-After header TMDB sends.
+SESSION = requests.Session()
+SEARCH_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                     respect_retry_after_header=True)
+
+
+def open_search_cache(org_path: Path) -> sqlite3.Connection:
+    """Open (creating if needed) the TMDB search cache for an org file."""
+    cache = sqlite3.connect(org_path.with_suffix('.tmdb_cache.sqlite'), check_same_thread=False)
+    cache.execute('CREATE TABLE IF NOT EXISTS cache '
+                  '(key TEXT PRIMARY KEY, ts INTEGER, json TEXT, etag TEXT)')
+    # Caches created before ETags were stored lack the column
+    columns = [row[1] for row in cache.execute('PRAGMA table_info(cache)')]
+    if 'etag' not in columns:
+        cache.execute('ALTER TABLE cache ADD COLUMN etag TEXT')
+    return cache
+
+
+def search_cache_key(title: str, year: Optional[int], language: str = 'de-DE') -> str:
+    """
+    Cache key for a search: the lowercased query plus the year, if any.
+    The language is only added for searches not made in de-DE, so keys
+    cached before the language was stored stay valid.
+    """
+    key = f"{title.lower()}|{year or ''}"
+    return key if language == 'de-DE' else f"{key}|{language}"
+
+
+def load_cached_search(cache: sqlite3.Connection,
+                       key: str) -> Tuple[Optional[List[Dict]], bool, Optional[str]]:
+    """
+    Return (results, fresh, etag) for a cached search, with results None
+    if it isn't cached. Stale results come with their ETag, if any, so
+    they can be revalidated.
+    """
+    with CACHE_LOCK:
+        row = cache.execute('SELECT json, ts, etag FROM cache WHERE key = ?', (key,)).fetchone()
+    if not row:
+        return None, False, None
+    cached_json, ts, etag = row
+    return json_loads(cached_json), ts > int(time.time()) - SEARCH_CACHE_MAX_AGE, etag
+
+
+def refresh_cached_search(cache: sqlite3.Connection, key: str):
+    """Mark a cached search as fresh again, after TMDB confirmed it is unchanged."""
+    with CACHE_LOCK:
+        cache.execute('UPDATE cache SET ts = ? WHERE key = ?', (int(time.time()), key))
+        cache.commit()
+
+
+def store_search(cache: sqlite3.Connection, key: str, results: List[Dict], etag: Optional[str]):
+    """Store the results of a search in the cache."""
+    with CACHE_LOCK:
+        cache.execute('INSERT OR REPLACE INTO cache (key, ts, json, etag) VALUES (?, ?, ?, ?)',
+                      (key, int(time.time()), json.dumps(results), etag))
+        cache.commit()
+
+
+def search_tmdb(title: str, year: Optional[int] = None, api_key: str = None,
+                cache: Optional[sqlite3.Connection] = None, language: str = 'de-DE') -> List[Dict]:
+    """
+    Search TMDB for a movie title, in German unless `language` says otherwise.
+    Returns list of potential matches, from the search cache when fresh
+    enough. Stale entries are revalidated with their ETag, so an unchanged
+    result (304 Not Modified) is not downloaded again.
+    """
+    if not api_key:
+        raise ValueError("TMDB API key required")
+
+    cached = None
+    headers = {}
+    if cache is not None:
+        key = search_cache_key(title, year, language)
+        cached, fresh, etag = load_cached_search(cache, key)
+        if fresh:
+            return cached
+        if cached is not None and etag:
+            headers['If-None-Match'] = etag
+
+    params = {
+        'api_key': api_key,
+        'query': title,
+        'language': language,
+        'include_adult': False
+    }
+
+    if year:
+        params['year'] = year
+
+    try:
+        LIMITER.acquire()
+        response = SESSION.get(TMDB_SEARCH_URL, params=params, headers=headers, timeout=10)
+        if response.status_code == 304 and cached is not None:
+            # Cached result is still current, just refresh its timestamp
+            refresh_cached_search(cache, key)
+            return cached
+        response.raise_for_status()
+        data = json_loads(response.content)
+        results = data.get('results', [])
+    except (requests.RequestException, ValueError) as e:
+        if cached is not None:
+            # Stale results beat none; they are revalidated next time
+            print(f"Error searching TMDB for '{title}', using cached results: {e}",
+                  file=sys.stderr)
+            return cached
+        print(f"Error searching TMDB for '{title}': {e}", file=sys.stderr)
+        return []
+
+    if cache is not None:
+        store_search(cache, key, results, response.headers.get('ETag'))
+
+    return results
+
+
+def search_all_tmdb(queries: List[Tuple[str, Optional[int]]], api_key: str,
+                    workers: int = MAX_WORKERS, cache: Optional[sqlite3.Connection] = None,
+                    language: str = 'de-DE') -> List[List[Dict]]:
+    """
+    Run many (title, year) searches concurrently, results in query order.
+    At most `workers` requests are in flight; LIMITER caps the rate.
+    Repeated queries (ignoring case) are only searched once.
+    """
+    unique = {}  # (lowercased title, year) -> first query with that key
+    for query in queries:
+        unique.setdefault((query[0].lower(), query[1]), query)
+    print(f"Deduped {len(queries)} queries to {len(unique)}")
+
+    # One pooled connection per worker
+    SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers,
+                                          max_retries=SEARCH_RETRY))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {key: executor.submit(search_tmdb, query[0], query[1], api_key, cache, language)
+                   for key, query in unique.items()}
+
+        # Report progress as searches finish, in whatever order they do
+        for done, _ in enumerate(as_completed(futures.values()), 1):
+            if done % 50 == 0 or done == len(futures):
+                print(f"  Searched {done}/{len(futures)}")
+    finally:
+        # Don't leave searches running if interrupted
+        executor.shutdown(cancel_futures=True)
+
+    return [futures[(query[0].lower(), query[1])].result() for query in queries]
+
+
+def write_org_file(org_path: Path, lines: List[str]):
+    """
+    Replace an org file with `lines`, in one write to a temporary file
+    that is then moved over it, so an interrupted write can't leave a
+    truncated org file behind.
+    """
+    temp_path = org_path.with_suffix('.org.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+    temp_path.replace(org_path)
+
+
+def calculate_match_score(title_score: float, year_hint: Optional[int],
+                          tmdb_year: Optional[str]) -> float:
+    """
+    Calculate confidence score for a TMDB match.
+    Takes the fuzzy title score and adds the year validation bonus.
+    """
+    base_score = title_score
+
+    # Boost score if years match
+    if year_hint and tmdb_year:
+        tmdb_year_int = int(tmdb_year.split('-')[0]) if tmdb_year else None
+        if tmdb_year_int == year_hint:
+            base_score = min(100, base_score + YEAR_MATCH_BONUS)
+        elif abs(tmdb_year_int - year_hint) <= 1:
+            base_score = min(100, base_score + NEAR_YEAR_BONUS)
+
+    return base_score
+
+
+def find_best_match(search_term: str, year_hint: Optional[int], api_key: str,
+                    cache: Optional[sqlite3.Connection] = None) -> Dict:
+    """
+    Find the best TMDB match for a search term.
+    Returns match info with confidence score.
+    """
+    # Try with year first if available
+    results = search_tmdb(search_term, year_hint, api_key, cache)
+
+    # If no results with year, try without
+    if not results and year_hint:
+        results = search_tmdb(search_term, None, api_key, cache)
+
+    no_match = {
+        'tmdb_id': None,
+        'confidence': 0,
+        'tmdb_title': None,
+        'tmdb_original_title': None,
+        'year': None,
+        'genres': None,
+        'needs_review': True,
+        'match_status': 'NO_RESULTS'
+    }
+
+    if not results:
+        return no_match
+
+    # Compare with both German title and original title of the top 10
+    # results, all in one batch call; each result keeps the better score.
+    # token_set_ratio ignores word order and duplicated words, and
+    # default_process lowercases and drops punctuation, so "Quantum Trost"
+    # still scores high against "James Bond 007: Ein Quantum Trost".
+    # The query and titles are normalized once up front, and an original
+    # title equal to the German title isn't scored twice.
+    # Titles that can't reach LOW_CONFIDENCE_THRESHOLD even with the year
+    # bonus are cut off inside rapidfuzz without being fully scored.
+    score_cutoff = LOW_CONFIDENCE_THRESHOLD - (YEAR_MATCH_BONUS if year_hint else 0)
+    query = utils.default_process(search_term)
+    top_results = results[:10]
+    choices = []
+    owners = []  # index into top_results of each choice
+    for index, result in enumerate(top_results):
+        title = utils.default_process(result.get('title') or '')
+        choices.append(title)
+        owners.append(index)
+        original_title = utils.default_process(result.get('original_title') or '')
+        if original_title != title:
+            choices.append(original_title)
+            owners.append(index)
+
+    title_scores = {}  # index into top_results -> best title score
+    for _, score, choice in process.extract(query, choices, scorer=fuzz.token_set_ratio,
+                                            processor=None, limit=None,
+                                            score_cutoff=score_cutoff):
+        index = owners[choice]
+        title_scores[index] = max(title_scores.get(index, 0), score)
+
+    # Score the remaining results, keeping the best match (the first one
+    # on ties)
+    best_score, best_result = None, None
+    for index in sorted(title_scores):
+        result = top_results[index]
+        score = calculate_match_score(title_scores[index], year_hint, result.get('release_date'))
+        if best_score is None or score > best_score:
+            best_score, best_result = score, result
+
+    # Nothing close enough, with or without a year hint
+    if best_score is None or best_score < LOW_CONFIDENCE_THRESHOLD:
+        return dict(no_match, match_status='NO_MATCH')
+
+    # Determine if review needed
+    needs_review = best_score < HIGH_CONFIDENCE_THRESHOLD
+    match_status = 'HIGH_CONFIDENCE' if best_score >= HIGH_CONFIDENCE_THRESHOLD else \
+                   'MEDIUM_CONFIDENCE' if best_score >= MEDIUM_CONFIDENCE_THRESHOLD else \
+                   'LOW_CONFIDENCE'
+
+    return {
+        'tmdb_id': best_result.get('id'),
+        'confidence': round(best_score, 2),
+        'tmdb_title': best_result.get('title'),
+        'tmdb_original_title': best_result.get('original_title'),
+        'year': best_result.get('release_date', '').split('-')[0] if best_result.get('release_date') else None,
+        'genres': None,  # Will be filled in Phase 2
+        'needs_review': needs_review,
+        'match_status': match_status
+    }
+
+
+def load_matched_line_numbers(output_path: Path) -> Set[int]:
+    """Return the line numbers of the entries already in an output CSV."""
+    if not output_path.exists():
+        return set()
+    with open(output_path, newline='', encoding='utf-8') as f:
+        return {int(row['line_number']) for row in csv.DictReader(f)}
+
+
+def new_stats() -> Dict:
+    """Zeroed match statistics, as returned by match_entries."""
+    return {
+        'total': 0,
+        'high_confidence': 0,
+        'medium_confidence': 0,
+        'low_confidence': 0,
+        'no_match': 0,
+        'needs_review': 0
+    }
+
+
+def match_entries(entries: List[Dict], search_field: str, fieldnames: List[str],
+                  org_path: Path, output_path: Path, api_key: str, use_cache: bool = True,
+                  workers: int = MAX_WORKERS, resume: bool = False) -> Dict:
+    """
+    Match org entries to TMDB and write one CSV row per entry.
+
+    Each entry is searched for by its `search_field` and its `year_hint`.
+    Searches run concurrently (`workers` at a time); results are
+    collected in file order and each one is written to the output CSV
+    (columns `fieldnames`) as soon as it's in, so an interrupted run
+    keeps what it has matched. With `resume`, entries already in the CSV
+    are skipped and new rows are appended.
+    Returns the match statistics; the matches themselves aren't kept.
+    """
+    stats = new_stats()
+    total_entries = len(entries)
+
+    # Skip entries an earlier, interrupted run already wrote to the CSV
+    matched = load_matched_line_numbers(output_path) if resume else set()
+    if matched:
+        entries = [entry for entry in entries if entry['line_number'] not in matched]
+        total_entries = len(entries)
+        print(f"Resuming: {len(matched)} entries already in {output_path}, {total_entries} left")
+
+    csv_row = operator.itemgetter(*fieldnames)  # match dict -> tuple of CSV values
+
+    cache = open_search_cache(org_path) if use_cache else None
+    # One pooled connection per worker
+    SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers,
+                                          max_retries=SEARCH_RETRY))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with open(output_path, 'a' if matched else 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            if not matched:
+                writer.writerow(fieldnames)
+
+            # Entries with the same search (title and year) share one
+            # search instead of querying TMDB again
+            searches = {}  # (lowercased title, year hint) -> future
+            futures = []
+            for entry in entries:
+                key = (entry[search_field].lower(), entry['year_hint'])
+                if key not in searches:
+                    searches[key] = executor.submit(find_best_match, entry[search_field],
+                                                    entry['year_hint'], api_key, cache)
+                futures.append(searches[key])
+
+            for processed, (entry, future) in enumerate(zip(entries, futures), start=1):
+                match_info = future.result()
+                print(f"[{processed}/{total_entries}] Processing: {entry[search_field]}", end='')
+
+                result = {
+                    **entry,
+                    **match_info
+                }
+                writer.writerow(csv_row(result))
+                csv_file.flush()
+
+                stats['total'] += 1
+                if match_info['confidence'] >= HIGH_CONFIDENCE_THRESHOLD:
+                    stats['high_confidence'] += 1
+                elif match_info['confidence'] >= MEDIUM_CONFIDENCE_THRESHOLD:
+                    stats['medium_confidence'] += 1
+                else:
+                    stats['low_confidence'] += 1
+                if match_info['tmdb_id'] is None:
+                    stats['no_match'] += 1
+                if match_info['needs_review']:
+                    stats['needs_review'] += 1
+
+                # Print result
+                status_icon = "✓" if not match_info['needs_review'] else "⚠"
+                print(f" → {status_icon} {match_info['match_status']} ({match_info['confidence']}%)")
+    finally:
+        # Don't leave searches running if interrupted
+        executor.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.close()
+
+    return stats
+
+
+def print_summary(stats: Dict, output_path: Path, next_step: str):
+    """
+    Print match statistics once the CSV has been written.
+    `next_step` is what to do with the verified CSV.
+    """
+    if not stats['total']:
+        print("\nNo matches to write.")
+        return
+
+    # Print statistics
+    total = stats['total']
+    high_conf = stats['high_confidence']
+    medium_conf = stats['medium_confidence']
+    low_conf = stats['low_confidence']
+    no_match = stats['no_match']
+
+    print(f"\n{'='*60}")
+    print(f"Matching Complete!")
+    print(f"{'='*60}")
+    print(f"Total entries:        {total}")
+    print(f"High confidence:      {high_conf} ({high_conf/total*100:.1f}%)")
+    print(f"Medium confidence:    {medium_conf} ({medium_conf/total*100:.1f}%)")
+    print(f"Low confidence:       {low_conf} ({low_conf/total*100:.1f}%)")
+    print(f"No match found:       {no_match} ({no_match/total*100:.1f}%)")
+    print(f"\nReview needed:        {stats['needs_review']}")
+    print(f"\nOutput written to: {output_path}")
+    print(f"\nNext steps:")
+    print(f"1. Review entries where needs_review=True")
+    print(f"2. Manually correct tmdb_id where needed")
+    print(f"3. {next_step}")
+
+
+def get_api_key_from_pass() -> str:
+    """Retrieve TMDB API key from GNU pass store."""
+    try:
+        result = subprocess.run(
+            ['pass', 'tmdb/api-key'],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return result.stdout.strip()
+    except subprocess.CalledProcessError as e:
+        print(f"Error retrieving API key from pass: {e}", file=sys.stderr)
+        sys.exit(1)
+    except FileNotFoundError:
+        print("Error: 'pass' command not found. Please install pass or provide API key as argument.", file=sys.stderr)
+        sys.exit(1)
+
+
+@functools.lru_cache(maxsize=1)
+def get_api_key() -> str:
+    """
+    Get the TMDB API key from the TMDB_API_KEY environment variable, or
+    from the pass store if that isn't set. Looked up once per process.
+    """
+    return os.environ.get('TMDB_API_KEY') or get_api_key_from_pass()
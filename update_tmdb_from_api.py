@@ -5,59 +5,28 @@ Uses SUGGESTED_SEARCH and YEAR fields to query the API.
 """
 
 import re
-import subprocess
 import sys
-import urllib.request
-import urllib.parse
-import json
-from typing import Optional, Dict, List, Tuple
+from pathlib import Path
+from typing import Optional, Dict, Iterator, List
+
+from tmdb_matcher import (
+    MAX_WORKERS,
+    get_api_key,
+    open_search_cache,
+    search_all_tmdb,
+    write_org_file,
+)
 
 
-TMDB_SEARCH_URL = "https://api.themoviedb.org/3/search/movie"
 ORG_FILE = "resources/review_required.org"
 
+# Property line pattern, compiled once
+PROPERTY_RE = re.compile(r'^:([A-Z_]+):\s*(.*)$')
+
 # Confidence threshold for auto-updating
 CONFIDENCE_THRESHOLD = 70
 
 
-def get_api_key() -> str:
-    """Get TMDB API key from pass."""
-    try:
-        result = subprocess.run(
-            ["pass", "tmdb/api-key"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error getting API key from pass: {e}", file=sys.stderr)
-        sys.exit(1)
-
-
-def search_tmdb(query: str, year: Optional[int], api_key: str) -> List[Dict]:
-    """Search TMDB for a movie."""
-    params = {
-        'api_key': api_key,
-        'query': query,
-        'language': 'de-DE',
-        'include_adult': 'false'
-    }
-
-    if year:
-        params['year'] = str(year)
-
-    url = f"{TMDB_SEARCH_URL}?{urllib.parse.urlencode(params)}"
-
-    try:
-        with urllib.request.urlopen(url, timeout=10) as response:
-            data = json.loads(response.read().decode())
-            return data.get('results', [])
-    except Exception as e:
-        print(f"Error querying TMDB for '{query}': {e}", file=sys.stderr)
-        return []
-
-
 def calculate_confidence(result: Dict, original_query: str, year: Optional[int]) -> float:
     """Calculate confidence score for a TMDB result."""
     confidence = result.get('popularity', 0)
@@ -81,62 +50,51 @@ def calculate_confidence(result: Dict, original_query: str, year: Optional[int])
     return min(confidence, 100)
 
 
-def parse_org_entry(lines: List[str], start_idx: int) -> Optional[Tuple[Dict, int]]:
+def parse_org_entries(lines: List[str]) -> Iterator[Dict]:
     """
-    Parse a single org entry starting at start_idx.
-    Returns (entry_dict, end_idx) or None if no valid entry found.
+    Parse the org entries that have a properties block, in one pass over
+    the lines. Yields one entry dict per headline, once its :END: is
+    reached; headlines without a complete properties block are skipped.
     """
-    if start_idx >= len(lines):
-        return None
-
-    # Find the headline
-    if not lines[start_idx].startswith('*'):
-        return None
-
-    headline = lines[start_idx]
-    entry = {
-        'headline': headline,
-        'start_line': start_idx,
-        'properties': {},
-        'property_lines': {}  # Track which line each property is on
-    }
-
-    # Find properties block
+    entry = None  # entry whose properties block we're looking for
     props_start = None
-    props_end = None
 
-    for i in range(start_idx + 1, len(lines)):
-        line = lines[i]
+    for i, line in enumerate(lines):
+        if line.startswith('*'):
+            entry = {
+                'headline': line,
+                'start_line': i,
+                'properties': {},
+                'property_lines': {}  # Track which line each property is on
+            }
+            props_start = None
+            continue
+
+        if entry is None:
+            continue
 
         if line.strip() == ':PROPERTIES:':
             props_start = i
         elif line.strip() == ':END:':
-            props_end = i
-            break
-        elif line.startswith('*'):
-            # Next entry
-            break
-
-    if props_start is not None and props_end is not None:
-        # Parse properties
-        for i in range(props_start + 1, props_end):
-            line = lines[i]
-            match = re.match(r'^:([A-Z_]+):\s*(.*)$', line)
-            if match:
-                key = match.group(1)
-                value = match.group(2)
-                entry['properties'][key] = value
-                entry['property_lines'][key] = i
+            if props_start is not None:
+                # Parse properties
+                for j in range(props_start + 1, i):
+                    match = PROPERTY_RE.match(lines[j])
+                    if match:
+                        key = match.group(1)
+                        value = match.group(2)
+                        entry['properties'][key] = value
+                        entry['property_lines'][key] = j
 
-        entry['end_line'] = props_end
-    else:
-        # No properties block, skip this entry
-        return (entry, start_idx + 1)
+                entry['end_line'] = i
+                yield entry
 
-    return (entry, props_end + 1)
+            # Only the first :END: after a headline counts
+            entry = None
 
 
-def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: Optional[int] = None):
+def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: Optional[int] = None,
+                    workers: int = MAX_WORKERS, use_cache: bool = True):
     """Update org file with TMDB data."""
 
     # Read the file
@@ -153,17 +111,9 @@ def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: O
         'skipped': 0
     }
 
-    # Parse entries
-    idx = 0
-    while idx < len(lines):
-        result = parse_org_entry(lines, idx)
-        if result is None:
-            idx += 1
-            continue
-
-        entry, next_idx = result
-        idx = next_idx
-
+    # Parse entries and collect the ones to search for
+    pending = []  # (entry, suggested_search, year)
+    for entry in parse_org_entries(lines):
         # Check if entry has SUGGESTED_SEARCH
         suggested_search = entry['properties'].get('SUGGESTED_SEARCH', '').strip()
         if not suggested_search:
@@ -185,13 +135,24 @@ def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: O
             except ValueError:
                 pass
 
+        pending.append((entry, suggested_search, year))
+
+    # Query TMDB for all of them at once
+    print(f"Searching TMDB for {len(pending)} entries ({workers} workers)...")
+    cache = open_search_cache(Path(org_file)) if use_cache else None
+    try:
+        all_results = search_all_tmdb([(search, year) for _, search, year in pending],
+                                      api_key, workers, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    for (entry, suggested_search, year), results in zip(pending, all_results):
         print(f"\n{'='*60}")
         print(f"Processing: {entry['headline'].strip()}")
         print(f"  Search: '{suggested_search}'" + (f" (year: {year})" if year else ""))
 
-        # Query TMDB
         stats['processed'] += 1
-        results = search_tmdb(suggested_search, year, api_key)
 
         if not results:
             print(f"  No results found")
@@ -251,28 +212,27 @@ def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: O
 
     # Apply updates
     if updates and not dry_run:
-        # Rebuild the file with updates
+        # Rebuild the file with updates, copying the unchanged lines
+        # between updated ones over in whole slices
         new_lines = []
-
-        for line_idx, line in enumerate(lines):
-            # Check if this line should be replaced or have insertions
-            if line_idx in updates:
-                update_value = updates[line_idx]
-                if isinstance(update_value, list):
-                    # This is an insertion point (before :END:)
-                    # Add all new properties before :END:
-                    for new_prop in update_value:
-                        new_lines.append(new_prop)
-                    new_lines.append(line)  # Add the :END: line
-                else:
-                    # This is a replacement
-                    new_lines.append(update_value)
+        copied_to = 0
+
+        for line_idx, update_value in sorted(updates.items()):
+            new_lines.extend(lines[copied_to:line_idx])
+            if isinstance(update_value, list):
+                # This is an insertion point (before :END:)
+                # Add all new properties before :END:
+                new_lines.extend(update_value)
+                new_lines.append(lines[line_idx])  # Add the :END: line
             else:
-                new_lines.append(line)
+                # This is a replacement
+                new_lines.append(update_value)
+            copied_to = line_idx + 1
+
+        new_lines.extend(lines[copied_to:])
 
         # Write back
-        with open(org_file, 'w', encoding='utf-8') as f:
-            f.writelines(new_lines)
+        write_org_file(Path(org_file), new_lines)
 
         print(f"\n{'='*60}")
         print(f"File updated: {org_file}")
@@ -293,27 +253,44 @@ def update_org_file(org_file: str, api_key: str, dry_run: bool = False, limit: O
 def main():
     """Main entry point."""
     dry_run = '--dry-run' in sys.argv
+    use_cache = '--no-cache' not in sys.argv
 
-    # Parse limit argument
+    # Parse limit, workers and API key arguments
     limit = None
+    workers = MAX_WORKERS
+    api_key = None
     for arg in sys.argv:
-        if arg.startswith('--limit='):
+        if arg.startswith('--api-key='):
+            api_key = arg.split('=', 1)[1]
+        elif arg.startswith('--limit='):
             try:
                 limit = int(arg.split('=')[1])
             except ValueError:
                 print(f"Invalid limit value: {arg}", file=sys.stderr)
                 sys.exit(1)
+        elif arg.startswith('--workers='):
+            try:
+                workers = int(arg.split('=')[1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print(f"Invalid workers value: {arg}", file=sys.stderr)
+                sys.exit(1)
 
-    print("Getting TMDB API key...")
-    api_key = get_api_key()
+    # Without --api-key, use TMDB_API_KEY or get it from pass
+    if not api_key:
+        print("Getting TMDB API key...")
+        api_key = get_api_key()
 
     print(f"Processing: {ORG_FILE}")
     if dry_run:
         print("(DRY RUN MODE)")
     if limit:
         print(f"(Limit: {limit} entries)")
+    if not use_cache:
+        print("(Search cache disabled)")
 
-    update_org_file(ORG_FILE, api_key, dry_run, limit)
+    update_org_file(ORG_FILE, api_key, dry_run, limit, workers, use_cache)
 
 
 if __name__ == '__main__':
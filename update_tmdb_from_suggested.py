@@ -6,93 +6,133 @@ Only processes entries with SUGGESTED_SEARCH that need review.
 
 import re
 import sys
-import time
-import subprocess
 from pathlib import Path
-from typing import Optional, List, Dict
-import requests
-from rapidfuzz import fuzz
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
 
-# TMDB API Configuration
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
-TMDB_SEARCH_URL = f"{TMDB_BASE_URL}/search/movie"
+from rapidfuzz import fuzz, process
 
-# Rate limiting
-RATE_LIMIT_DELAY = 0.25  # 4 requests per second
+from tmdb_matcher import (
+    MAX_WORKERS,
+    get_api_key,
+    open_search_cache,
+    search_all_tmdb,
+    write_org_file,
+)
+
+# Property line and search year patterns, compiled once
+PROPERTY_RE = re.compile(r":([^:]+):\s*(.*)")
+SEARCH_YEAR_RE = re.compile(r'\b(19\d{2}|20[0-2]\d)\b')  # year inside a search term
+
+# Titles are searched in TMDB's default language rather than de-DE;
+# the search cache keeps these results apart from the de-DE ones.
+SEARCH_LANGUAGE = "en-US"
+
+
+def read_org_entries(f: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Yield the lines of an org file one top-level entry at a time. Text
+    before the first heading, if any, comes first.
+    """
+    entry_lines = []
+    for line in f:
+        if line.startswith("* ") and entry_lines:
+            yield entry_lines
+            entry_lines = []
+        entry_lines.append(line)
+
+    if entry_lines:
+        yield entry_lines
+
+
+def parse_entry(entry_lines: List[str], first_line: int) -> Optional[Dict]:
+    """
+    Parse one entry as yielded by read_org_entries, whose heading is at
+    index first_line of the lines being collected. Returns None for the
+    text before the first heading.
+    """
+    if not entry_lines[0].startswith("* "):
+        return None
+
+    entry = {
+        "line_number": first_line,
+        "heading": entry_lines[0][2:].rstrip("\n"),
+        "properties_start": None,
+        "properties_end": None,
+        "properties": {},
+        "end_line": first_line + len(entry_lines),
+    }
+
+    for i in range(1, len(entry_lines)):
+        line = entry_lines[i]
+        if line.strip() == ":PROPERTIES:":
+            entry["properties_start"] = first_line + i
+        elif line.strip() == ":END:":
+            entry["properties_end"] = first_line + i
+        elif entry["properties_start"] is not None and entry["properties_end"] is None:
+            match = PROPERTY_RE.match(line.strip())
+            if match:
+                prop_name = match.group(1)
+                prop_value = match.group(2)
+                entry["properties"][prop_name] = prop_value
+
+    return entry
+
+
+def needs_update(entry: Dict) -> bool:
+    """Whether an entry has a SUGGESTED_SEARCH and still needs a TMDB match."""
+    props = entry["properties"]
+
+    # Skip if no SUGGESTED_SEARCH
+    if "SUGGESTED_SEARCH" not in props:
+        return False
+
+    # Skip if already has TMDB_ID and doesn't need review
+    if "TMDB_ID" in props and props.get("NEEDS_REVIEW") != "true":
+        return False
+
+    return True
 
 
 def parse_org_file(org_path: Path) -> tuple[List[Dict], List[str]]:
     """
     Parse org file and extract entries with SUGGESTED_SEARCH that need review.
     Returns (entries, lines) where entries contain all parsed data.
-    """
-    with open(org_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
 
+    The file is read and parsed one entry at a time; lines holds every
+    line of the file, so line numbers in entries index into it.
+    """
     entries = []
-    current_entry = None
-
-    for i, line in enumerate(lines):
-        if line.startswith("* "):
-            if current_entry is not None:
-                current_entry["end_line"] = i
-                entries.append(current_entry)
-
-            heading_text = line[2:].rstrip("\n")
-            current_entry = {
-                "line_number": i,
-                "heading": heading_text,
-                "properties_start": None,
-                "properties_end": None,
-                "properties": {},
-            }
-
-        elif current_entry is not None:
-            if line.strip() == ":PROPERTIES:":
-                current_entry["properties_start"] = i
-            elif line.strip() == ":END:":
-                current_entry["properties_end"] = i
-            elif current_entry["properties_start"] is not None and current_entry["properties_end"] is None:
-                match = re.match(r":([^:]+):\s*(.*)", line.strip())
-                if match:
-                    prop_name = match.group(1)
-                    prop_value = match.group(2)
-                    current_entry["properties"][prop_name] = prop_value
-
-    # Don't forget the last entry
-    if current_entry is not None:
-        current_entry["end_line"] = len(lines)
-        entries.append(current_entry)
+    lines = []
 
-    return entries, lines
+    with open(org_path, "r", encoding="utf-8") as f:
+        for entry_lines in read_org_entries(f):
+            entry = parse_entry(entry_lines, len(lines))
+            if entry is not None and needs_update(entry):
+                entries.append(entry)
+            lines.extend(entry_lines)
 
+    return entries, lines
 
-def search_tmdb(title: str, year: Optional[int] = None, api_key: str = None) -> List[Dict]:
-    """Search TMDB for a movie title."""
-    params = {
-        "api_key": api_key,
-        "query": title,
-        "include_adult": "false",
-    }
 
-    if year:
-        params["year"] = year
+def get_year_hint(props: Dict) -> Optional[int]:
+    """Year hint from the YEAR property, else from a year in SUGGESTED_SEARCH."""
+    year_hint = None
+    if "YEAR" in props:
+        try:
+            year_hint = int(props["YEAR"])
+        except ValueError:
+            pass
 
-    try:
-        response = requests.get(TMDB_SEARCH_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("results", [])
-    except Exception as e:
-        print(f"  Error searching TMDB: {e}", file=sys.stderr)
-        return []
+    if not year_hint:
+        year_match = SEARCH_YEAR_RE.search(props["SUGGESTED_SEARCH"])
+        if year_match:
+            year_hint = int(year_match.group(1))
 
+    return year_hint
 
-def calculate_confidence(original: str, suggested: str, tmdb_title: str, year_hint: Optional[int], tmdb_year: Optional[str]) -> float:
-    """Calculate match confidence score."""
-    # Title similarity
-    title_ratio = fuzz.ratio(suggested.lower(), tmdb_title.lower())
 
+def calculate_confidence(title_ratio: float, year_hint: Optional[int], tmdb_year: Optional[str]) -> float:
+    """Calculate match confidence score from the title similarity and the year."""
     # Year bonus
     year_bonus = 0
     if year_hint and tmdb_year:
@@ -108,99 +148,85 @@ def calculate_confidence(original: str, suggested: str, tmdb_title: str, year_hi
     return min(100, title_ratio + year_bonus)
 
 
-def get_api_key_from_pass() -> str:
-    """Retrieve TMDB API key from GNU pass store."""
-    try:
-        result = subprocess.run(
-            ['pass', 'tmdb/api-key'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error retrieving API key from pass: {e}", file=sys.stderr)
-        sys.exit(1)
-    except FileNotFoundError:
-        print("Error: 'pass' command not found. Please install pass or provide API key as argument.", file=sys.stderr)
-        sys.exit(1)
-
-
-def update_org_entries(org_path: Path, api_key: str, dry_run: bool = False) -> int:
+def find_best_match(suggested: str, results: List[Dict], year_hint: Optional[int]) -> Tuple[Optional[Dict], float]:
     """
-    Update org file entries with TMDB_ID from SUGGESTED_SEARCH queries.
-    Returns number of entries updated.
+    Pick the best of the top 5 search results for a search.
+    Returns (result, confidence), or (None, 0) if none scores above 0.
     """
-    entries, lines = parse_org_file(org_path)
+    query = suggested.lower()
 
-    # Filter entries that need processing
-    to_process = []
-    for entry in entries:
-        props = entry["properties"]
+    # The top result has exactly the searched title: that's the highest
+    # confidence there is, so don't score the others
+    if results[0].get("title", "").lower() == query:
+        return results[0], 100
 
-        # Skip if no SUGGESTED_SEARCH
-        if "SUGGESTED_SEARCH" not in props:
-            continue
+    # Score all candidate titles against the search in one batch call
+    candidates = results[:5]
+    title_ratios = [0.0] * len(candidates)
+    for _, title_ratio, i in process.extract(
+        query,
+        [result.get("title", "").lower() for result in candidates],
+        scorer=fuzz.ratio,
+        processor=None,
+        limit=None
+    ):
+        title_ratios[i] = title_ratio
 
-        # Skip if already has TMDB_ID and doesn't need review
-        if "TMDB_ID" in props and props.get("NEEDS_REVIEW") != "true":
-            continue
+    best_match = None
+    best_confidence = 0
 
-        to_process.append(entry)
+    for result, title_ratio in zip(candidates, title_ratios):
+        confidence = calculate_confidence(title_ratio, year_hint, result.get("release_date", ""))
+
+        if confidence > best_confidence:
+            best_confidence = confidence
+            best_match = result
+
+    return best_match, best_confidence
+
+
+def update_org_entries(org_path: Path, api_key: str, dry_run: bool = False,
+                       workers: int = MAX_WORKERS, use_cache: bool = True) -> int:
+    """
+    Update org file entries with TMDB_ID from SUGGESTED_SEARCH queries.
+    Returns number of entries updated.
+    """
+    to_process, lines = parse_org_file(org_path)
 
     print(f"Found {len(to_process)} entries to process")
 
     updates = 0
+    pending_edits = []  # (start, end, new lines) of properties blocks to replace
+
+    # Search TMDB for all entries at once
+    year_hints = [get_year_hint(entry["properties"]) for entry in to_process]
+    cache = open_search_cache(org_path) if use_cache else None
+    try:
+        all_results = search_all_tmdb(
+            [(entry["properties"]["SUGGESTED_SEARCH"], year_hint)
+             for entry, year_hint in zip(to_process, year_hints)],
+            api_key,
+            workers,
+            cache,
+            SEARCH_LANGUAGE
+        )
+    finally:
+        if cache is not None:
+            cache.close()
 
-    for idx, entry in enumerate(to_process, 1):
+    for idx, (entry, year_hint, results) in enumerate(zip(to_process, year_hints, all_results), 1):
         props = entry["properties"]
         suggested_search = props["SUGGESTED_SEARCH"]
         heading = entry["heading"]
 
-        # Extract year hint from SUGGESTED_SEARCH or YEAR property
-        year_hint = None
-        if "YEAR" in props:
-            try:
-                year_hint = int(props["YEAR"])
-            except ValueError:
-                pass
-
-        if not year_hint:
-            year_match = re.search(r'\b(19\d{2}|20[0-2]\d)\b', suggested_search)
-            if year_match:
-                year_hint = int(year_match.group(1))
-
         print(f"\n[{idx}/{len(to_process)}] {heading}")
         print(f"  Searching: {suggested_search}" + (f" ({year_hint})" if year_hint else ""))
 
-        # Search TMDB
-        results = search_tmdb(suggested_search, year_hint, api_key)
-        time.sleep(RATE_LIMIT_DELAY)
-
         if not results:
             print(f"  No results found")
             continue
 
-        # Find best match
-        best_match = None
-        best_confidence = 0
-
-        for result in results[:5]:  # Check top 5 results
-            tmdb_title = result.get("title", "")
-            tmdb_year = result.get("release_date", "")
-            tmdb_id = result.get("id")
-
-            confidence = calculate_confidence(
-                heading,
-                suggested_search,
-                tmdb_title,
-                year_hint,
-                tmdb_year
-            )
-
-            if confidence > best_confidence:
-                best_confidence = confidence
-                best_match = result
+        best_match, best_confidence = find_best_match(suggested_search, results, year_hint)
 
         if best_match:
             tmdb_id = best_match["id"]
@@ -221,10 +247,11 @@ def update_org_entries(org_path: Path, api_key: str, dry_run: bool = False) -> i
                     prop_lines.append(f":{prop_name}: {prop_value}\n")
                 prop_lines.append(":END:\n")
 
-                # Replace in lines
+                # Replace in lines once all entries are done, so the
+                # line numbers of the entries after this one stay valid
                 start = entry["properties_start"]
                 end = entry["properties_end"] + 1
-                lines[start:end] = prop_lines
+                pending_edits.append((start, end, prop_lines))
 
                 updates += 1
         else:
@@ -233,8 +260,18 @@ def update_org_entries(org_path: Path, api_key: str, dry_run: bool = False) -> i
     # Write back if not dry run
     if not dry_run and updates > 0:
         print(f"\nWriting {updates} updates to {org_path.name}...")
-        with open(org_path, "w", encoding="utf-8") as f:
-            f.writelines(lines)
+
+        # Edits are in file order; copy the lines between them over in
+        # whole slices
+        new_lines = []
+        copied_to = 0
+        for start, end, prop_lines in pending_edits:
+            new_lines.extend(lines[copied_to:start])
+            new_lines.extend(prop_lines)
+            copied_to = max(start, end)
+        new_lines.extend(lines[copied_to:])
+
+        write_org_file(org_path, new_lines)
         print("Done!")
     elif dry_run:
         print(f"\nDry run complete - would have updated {updates} entries")
@@ -244,9 +281,26 @@ def update_org_entries(org_path: Path, api_key: str, dry_run: bool = False) -> i
 
 def main():
     dry_run = "--dry-run" in sys.argv
+    use_cache = "--no-cache" not in sys.argv
+
+    workers = MAX_WORKERS
+    api_key = None
+    for arg in sys.argv:
+        if arg.startswith("--api-key="):
+            api_key = arg.split("=", 1)[1]
+        elif arg.startswith("--workers="):
+            try:
+                workers = int(arg.split("=")[1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print(f"Invalid workers value: {arg}", file=sys.stderr)
+                return 1
 
-    print("Retrieving API key from pass store (tmdb/api-key)...")
-    api_key = get_api_key_from_pass()
+    # Without --api-key, use TMDB_API_KEY or get it from the pass store
+    if not api_key:
+        print("Retrieving API key (TMDB_API_KEY or pass store tmdb/api-key)...")
+        api_key = get_api_key()
 
     script_dir = Path(__file__).parent
     resources_dir = script_dir / "resources"
@@ -259,8 +313,10 @@ def main():
     print(f"Processing {org_path}")
     if dry_run:
         print("DRY RUN MODE - no changes will be made")
+    if not use_cache:
+        print("Search cache disabled - querying TMDB for every entry")
 
-    updates = update_org_entries(org_path, api_key, dry_run)
+    updates = update_org_entries(org_path, api_key, dry_run, workers, use_cache)
 
     print(f"\nTotal updates: {updates}")
 